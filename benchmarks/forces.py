@@ -0,0 +1,87 @@
+"""Compare the force backends with direct summation.
+
+First the error and cost of one evaluation of the accelerations for random
+clusters of growing size, with the Barnes-Hut tree code at several opening
+angles and the tiled direct summation on several numbers of threads, whose
+results must not depend on them. Then whole runs of the two and three body
+setups of the GUI with direct summation and the tree code. Run from the
+repository root:
+
+    python -m benchmarks.forces --bodies 100 1000 4000 --thetas 0.3 0.5 0.8 --threads 1 4 16
+"""
+import argparse
+import os
+import time
+
+import numpy as np
+
+from simulation import G, BarnesHutProblem, NBodyProblem, TiledProblem, simulate
+
+from .integrators import MASSES, POSITIONS, VELOCITIES
+
+
+def timed(function, *args, repeat=3):
+    """Result of function(*args) and its best time out of `repeat` calls."""
+    best = np.inf
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = function(*args)
+        best = min(best, time.perf_counter() - start)
+    return result, best
+
+
+def cluster(n, seed=0):
+    """n bodies of the masses of the GUI scattered over a few thousand km."""
+    rng = np.random.default_rng(seed)
+    return rng.uniform(1e20, 1e22, n), rng.standard_normal((n, 3)) * 3000
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--bodies', type=int, nargs='+', default=[10, 100, 1000, 3000], help='cluster sizes')
+    parser.add_argument('--thetas', type=float, nargs='+', default=[0.3, 0.5, 0.8], help='opening angles')
+    parser.add_argument('--threads', type=int, nargs='+', default=[1, os.cpu_count()],
+                        help='thread counts of the parallel backend')
+    parser.add_argument('--span', type=float, default=4800, help='simulated time of the GUI setups in s')
+    parser.add_argument('--dt', type=float, default=5, help='sample spacing in s')
+    parser.add_argument('--method', default='yoshida4', help='integrator of the GUI setups')
+    args = parser.parse_args()
+
+    print('One evaluation of the accelerations, error relative to direct summation')
+    print(f'{"bodies":>8}{"theta":>8}{"seconds":>12}{"speedup":>10}{"max error":>12}{"median":>12}')
+    for n in args.bodies:
+        masses, r = cluster(n)
+        exact, direct = timed(lambda: NBodyProblem(masses, G).accelerations(r).copy())
+        print(f'{n:>8}{"direct":>8}{direct:>12.4f}{1:>10.1f}')
+        for theta in args.thetas:
+            model = BarnesHutProblem(masses, G, theta)
+            acc, seconds = timed(lambda: model.accelerations(r).copy())
+            error = np.linalg.norm(acc - exact, axis=1) / np.linalg.norm(exact, axis=1)
+            print(f'{n:>8}{theta:>8}{seconds:>12.4f}{direct / seconds:>10.1f}{error.max():>12.2e}{np.median(error):>12.2e}')
+
+        reference = None
+        for threads in args.threads:
+            model = TiledProblem(masses, G, threads)
+            acc, seconds = timed(lambda: model.accelerations(r).copy())
+            reference = acc if reference is None else reference
+            same = 'identical' if np.array_equal(acc, reference) else 'DIFFERENT'
+            error = np.abs(acc - exact).max() / np.abs(exact).max()
+            print(f'{n:>8}{f"{threads} thr":>8}{seconds:>12.4f}{direct / seconds:>10.1f}{error:>12.2e}  {same}')
+
+    t = np.arange(0, args.span, args.dt)
+    print()
+    print(f'The GUI setups over {len(t)} samples with {args.method}, deviation from direct summation')
+    print(f'{"bodies":>8}{"theta":>8}{"seconds":>12}{"slowdown":>10}{"max deviation km":>18}')
+    for n in (2, 3):
+        inputs = MASSES[:n], POSITIONS[:n], VELOCITIES[:n], t
+        exact, direct = timed(lambda: simulate(*inputs, method=args.method).r_sol[:], repeat=1)
+        print(f'{n:>8}{"direct":>8}{direct:>12.3f}{1:>10.1f}')
+        for theta in args.thetas:
+            r, seconds = timed(lambda: simulate(*inputs, method=args.method, force='barnes-hut', theta=theta).r_sol[:],
+                               repeat=1)
+            deviation = np.linalg.norm(r - exact, axis=2).max()
+            print(f'{n:>8}{theta:>8}{seconds:>12.3f}{seconds / direct:>10.1f}{deviation:>18.2e}')
+
+
+if __name__ == '__main__':
+    main()
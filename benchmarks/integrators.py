@@ -0,0 +1,64 @@
+"""Compare the integrators on throughput and energy conservation.
+
+Runs the default three body setup of the GUI over many orbits with every
+method and prints steps per second and the worst relative error of the total
+energy. Run from the repository root:
+
+    python -m benchmarks.integrators --span 48000 --dt 5
+"""
+import argparse
+import time
+
+import numpy as np
+
+from simulation import METHODS, kinetic_energy, simulate
+from simulation import symplectic
+
+MASSES = [1e26, 1e20, 1e10]
+POSITIONS = [[0, 0, 0], [0, 3000, 0], [3000, 0, 0]]
+VELOCITIES = [[10, 20, 30], [0, 40, 0], [0, 40, 0]]
+
+
+def internal_energy(sim):
+    """Total energy of every sample in the center of mass frame.
+
+    The uniform motion of the heavy body would otherwise swamp the errors.
+    """
+    m = sim.masses
+    v = sim.v_sol - np.tensordot(sim.v_sol, m, axes=(1, 0))[:, np.newaxis, :] / m.sum()
+    return kinetic_energy(m, v).sum(axis=1) + sim.PE[:]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--span', type=float, default=48000, help='simulated time in s')
+    parser.add_argument('--dt', type=float, default=5, help='sample spacing in s')
+    parser.add_argument('--substeps', type=int, default=1, help='steps per sample of the symplectic methods')
+    parser.add_argument('--bodies', type=int, default=3, choices=(2, 3))
+    parser.add_argument('--methods', nargs='+', default=METHODS, choices=METHODS)
+    args = parser.parse_args()
+
+    n = args.bodies
+    t = np.arange(0, args.span, args.dt)
+
+    print(f'{len(t)} samples, {n} bodies')
+    print(f'{"method":<15}{"seconds":>10}{"steps/s":>12}{"energy error":>15}')
+    for method in args.methods:
+        if method == 'kepler' and n != 2:
+            continue
+        # Keep the scipy import out of the timing
+        simulate(MASSES[:n], POSITIONS[:n], VELOCITIES[:n], t[:2], method=method)
+
+        start = time.perf_counter()
+        sim = simulate(MASSES[:n], POSITIONS[:n], VELOCITIES[:n], t, method=method, substeps=args.substeps)
+        seconds = time.perf_counter() - start
+
+        E = internal_energy(sim)
+        error = np.abs((E - E[0]) / E[0]).max()
+        # odeint and solve_ivp pick their own steps, count samples for them
+        steps = len(t) * (args.substeps if method in symplectic.METHODS else 1)
+        print(f'{method:<15}{seconds:>10.3f}{steps / seconds:>12.0f}{error:>15.2e}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,58 @@
+"""Compare the NumPy and the numba compiled N-body kernels.
+
+Prints right hand side evaluations per second, as odeint makes them, and
+leapfrog steps per second for a few numbers of bodies. Without numba only
+the NumPy rows are printed. Run from the repository root:
+
+    python -m benchmarks.kernels --bodies 2 3 10 100
+"""
+import argparse
+import time
+
+import numpy as np
+
+from simulation import G, NBodyProblem, kernels, symplectic
+
+from .forces import cluster
+
+
+def rate(function, seconds):
+    """Calls of function per second, measured for about `seconds`."""
+    calls, start = 0, time.perf_counter()
+    while True:
+        function()
+        calls += 1
+        elapsed = time.perf_counter() - start
+        if elapsed >= seconds:
+            return calls / elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--bodies', type=int, nargs='+', default=[2, 3, 10, 100])
+    parser.add_argument('--seconds', type=float, default=1.0, help='time spent on every measurement')
+    parser.add_argument('--steps', type=int, default=2000, help='leapfrog steps per measurement')
+    args = parser.parse_args()
+
+    backends = [('numpy', False)] + ([('numba', True)] if kernels.JIT else [])
+    if not kernels.JIT:
+        print('numba is not installed, only the NumPy kernels are measured')
+
+    print(f'{"bodies":>8}{"kernel":>8}{"rhs/s":>14}{"steps/s":>14}')
+    for n in args.bodies:
+        masses, r = cluster(n)
+        y = np.concatenate([r.ravel(), np.zeros(3 * n)])
+        t = np.linspace(0, 1, args.steps + 1)
+        for name, jit in backends:
+            model = NBodyProblem(masses, G, jit=jit)
+            # The first calls compile or load the cached kernels
+            model(y, 0.0)
+            symplectic.leapfrog(model, y, t[:2], symplectic.YOSHIDA4)
+
+            rhs = rate(lambda: model(y, 0.0), args.seconds)
+            steps = args.steps * rate(lambda: symplectic.leapfrog(model, y, t, (1.0,)), args.seconds)
+            print(f'{n:>8}{name:>8}{rhs:>14.0f}{steps:>14.0f}')
+
+
+if __name__ == '__main__':
+    main()
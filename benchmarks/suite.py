@@ -0,0 +1,184 @@
+"""Benchmark suite of the integration and rendering hot paths.
+
+Times the integration of the two and three body setups of the GUI over
+growing time grids, the energies derived from a finished run, and frames of
+the GUI animation (MainWindow.animate_func on an offscreen canvas) at
+several trace lengths with and without the energy plots. Every case
+reports its throughput and the peak memory it allocated, and the results
+are written to JSON together with the commit, so runs of two commits can
+be compared:
+
+    python -m benchmarks.suite --out before.json
+    python -m benchmarks.suite --out after.json --compare before.json
+"""
+import argparse
+import json
+import os
+import platform
+import subprocess
+import sys
+import time
+import tracemalloc
+
+import numpy as np
+
+from simulation import simulate
+
+from .integrators import MASSES, POSITIONS, VELOCITIES
+
+DT = 0.5
+
+
+def measure(function, repeat):
+    """Best time of `repeat` calls of function, then its peak allocation in MB."""
+    best = np.inf
+    for _ in range(repeat):
+        start = time.perf_counter()
+        function()
+        best = min(best, time.perf_counter() - start)
+
+    # A separate call, tracing allocations slows the code down
+    tracemalloc.start()
+    function()
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return best, peak / 1e6
+
+
+def result(name, params, seconds, work, unit, peak):
+    row = dict(name=name, params=params, seconds=seconds, throughput=work / seconds, unit=unit, peak_mb=peak)
+    print(f'{name:<10}{json.dumps(params):<44}{row["throughput"]:>14.1f} {unit:<10}{peak:>10.1f} MB', flush=True)
+    return row
+
+
+def integration(sizes, methods, repeat):
+    rows = []
+    for n in (2, 3):
+        for method in methods:
+            # Keep the scipy import out of the timing
+            simulate(MASSES[:n], POSITIONS[:n], VELOCITIES[:n], [0, DT], method=method)
+            for samples in sizes:
+                t = np.arange(samples) * DT
+                inputs = MASSES[:n], POSITIONS[:n], VELOCITIES[:n], t
+                seconds, peak = measure(lambda: simulate(*inputs, method=method), repeat)
+                rows.append(result('integrate', dict(bodies=n, method=method, samples=samples),
+                                   seconds, samples, 'samples/s', peak))
+    return rows
+
+
+def energies(sizes, repeat):
+    rows = []
+    for n in (2, 3):
+        for samples in sizes:
+            t = np.arange(samples) * DT
+            sim = simulate(MASSES[:n], POSITIONS[:n], VELOCITIES[:n], t)
+
+            def derive():
+                # What the GUI plots: kinetic energy per body and the total
+                return sim.KE[:], sim.PE[:], sim.totalE[:]
+
+            seconds, peak = measure(derive, repeat)
+            rows.append(result('energy', dict(bodies=n, samples=samples), seconds, samples, 'samples/s', peak))
+    return rows
+
+
+def frames(traces, count):
+    """Frames per second of the GUI animation, nothing without PyQt6."""
+    os.environ.setdefault('QT_QPA_PLATFORM', 'offscreen')
+    try:
+        from PyQt6.QtWidgets import QApplication
+    except ImportError:
+        print('PyQt6 is not installed, skipping the frames')
+        return []
+    app = QApplication.instance() or QApplication(sys.argv[:1])
+    import plot_gui_multiple
+
+    window = plot_gui_multiple.MainWindow(objectName='MainWindow')
+    window.timef.setText(str((max(traces) + count + 1) * DT))
+    window.timedt.setText(str(DT))
+    window.anim_start_stop()
+    while window.computing:
+        app.processEvents()
+    window.timer.stop()
+    app.processEvents()
+
+    rows = []
+    for energy in (False, True):
+        if window.energy_plot_shown != energy:
+            window.view_energy_func()
+        for trace in traces:
+            def play():
+                # Each frame advances one sample from the trace length on
+                for i in range(count):
+                    window.clock.reset(trace + i)
+                    window.animate_func()
+                app.processEvents()
+
+            seconds, peak = measure(play, 1)
+            rows.append(result('frames', dict(trace=trace, energy=energy), seconds, count, 'frames/s', peak))
+
+    window.close()
+    return rows
+
+
+def metadata():
+    try:
+        commit = subprocess.run(['git', 'rev-parse', 'HEAD'], capture_output=True, text=True, check=True,
+                                cwd=os.path.dirname(os.path.abspath(__file__))).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        commit = None
+    import matplotlib
+    import scipy
+    return dict(commit=commit, date=time.strftime('%Y-%m-%dT%H:%M:%S'), python=platform.python_version(),
+                numpy=np.__version__, scipy=scipy.__version__, matplotlib=matplotlib.__version__,
+                machine=platform.platform(), cpus=os.cpu_count())
+
+
+def compare(rows, path):
+    with open(path) as f:
+        before = {(row['name'], json.dumps(row['params'], sort_keys=True)): row for row in json.load(f)['results']}
+
+    print()
+    print(f'Throughput relative to {path}, above 1 is faster')
+    for row in rows:
+        old = before.get((row['name'], json.dumps(row['params'], sort_keys=True)))
+        if old is not None:
+            ratio = row['throughput'] / old['throughput']
+            print(f'{row["name"]:<10}{json.dumps(row["params"]):<44}{ratio:>8.2f}x'
+                  f'{row["peak_mb"] - old["peak_mb"]:>+10.1f} MB')
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--out', default='benchmarks.json', help='results file (JSON)')
+    parser.add_argument('--compare', metavar='JSON', help='results of an earlier run to compare with')
+    parser.add_argument('--quick', action='store_true', help='smaller sizes, for a fast check')
+    parser.add_argument('--methods', nargs='+', default=['odeint', 'auto'], help='integrators to time')
+    parser.add_argument('--repeat', type=int, default=3, help='timings per case, the best counts')
+    parser.add_argument('--skip', nargs='+', default=[], choices=('integrate', 'energy', 'frames'))
+    args = parser.parse_args()
+
+    if args.quick:
+        sizes, traces, count = [1000, 10000], [100, 10000], 30
+    else:
+        sizes, traces, count = [1000, 10000, 100000], [100, 10000, 100000], 100
+
+    print(f'{"case":<10}{"parameters":<44}{"throughput":>14} {"":<10}{"peak":>10}')
+    rows = []
+    if 'integrate' not in args.skip:
+        rows += integration(sizes, args.methods, args.repeat)
+    if 'energy' not in args.skip:
+        rows += energies([10 * i for i in sizes], args.repeat)
+    if 'frames' not in args.skip:
+        rows += frames(traces, count)
+
+    with open(args.out, 'w') as f:
+        json.dump(dict(meta=metadata(), results=rows), f, indent=2)
+    print(f'Wrote {len(rows)} results to {args.out}')
+
+    if args.compare:
+        compare(rows, args.compare)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,284 @@
+"""Render the animation of a saved run to a video or image files.
+
+The plots of the GUI are drawn on an offscreen Agg canvas, without Qt, and
+every frame goes straight into an ffmpeg pipe or an image file. The frames
+are split into contiguous ranges which a pool of worker processes renders
+in parallel; each worker opens the run itself, so only the path is sent to
+it, and for videos encodes its range to a segment file. The segments are
+joined at the end without encoding again.
+
+Runs are read from a run file (File > Save Run, simulation.runfile) or a
+directory written by simulate(..., directory=...):
+
+    python export.py run.npz orbit.mp4 --frames 10000 --fps 60
+    python export.py run.npz frames/orbit_%05d.png --energy
+
+Videos need ffmpeg on the PATH, image sequences only need matplotlib.
+"""
+import argparse
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+import numpy as np
+from matplotlib.backends.backend_agg import FigureCanvasAgg
+from matplotlib.figure import Figure
+from PIL import Image
+
+from renderer import OrbitView, EnergyView, BlitManager
+from simulation import runfile, store
+
+# The initial colors of the GUI, bodies 1 to 3 and the center of gravity
+COLORS = ["#FF5000", "#563843", "#456753", "#342482"]
+BACKGROUND = "#989898"
+
+IMAGES = ('.png', '.jpg', '.jpeg', '.tif', '.tiff', '.bmp')
+
+# ffmpeg output options of every video container. GIFs cannot be joined
+# without decoding, their segments are stored losslessly and the palette
+# is computed once for the whole animation.
+CODECS = {
+    '.mp4': ['-c:v', 'libx264', '-pix_fmt', 'yuv420p', '-crf', '18'],
+    '.mov': ['-c:v', 'libx264', '-pix_fmt', 'yuv420p', '-crf', '18'],
+    '.mkv': ['-c:v', 'libx264', '-pix_fmt', 'yuv420p', '-crf', '18'],
+    '.webm': ['-c:v', 'libvpx-vp9', '-pix_fmt', 'yuv420p', '-crf', '32', '-b:v', '0'],
+    '.gif': ['-c:v', 'ffv1'],
+}
+SEGMENT = {'.gif': '.mkv'}
+
+
+class Scene:
+    """The plots of the GUI for one trajectory on an offscreen canvas.
+
+    params are the GUI inputs stored with a run, their colors and radii are
+    used where present. Only the moving artists are drawn for a frame, over
+    the background drawn once, like playback in the GUI.
+    """
+
+    def __init__(self, trajectory, params=None, width=1280, height=720, dpi=100, energy=False, trail='full'):
+        params = params or {}
+        self.fig = Figure(figsize=(width / dpi, height / dpi), dpi=dpi)
+        self.canvas = FigureCanvasAgg(self.fig)
+        self.fig.set_facecolor(BACKGROUND)
+
+        ax = self.fig.add_subplot(331, projection='3d')
+        ax2 = self.fig.add_subplot(332, projection='3d')
+        ax.set_title("Non-inertial frame of reference")
+        ax2.set_title("Center of Gravity frame of reference", x=.7, y=-0.1)
+        ax2.set_position([-0.01, 0.02, 0.3, 0.3])
+        axes = [ax, ax2]
+
+        if energy:
+            ax.set_position([-0.12, 0.25, 0.8, 0.8])
+            energy_axes = [self.fig.add_axes(rect) for rect in
+                           ([0.7, 0.4, 0.25, 0.25], [0.7, 0.7, 0.25, 0.25], [0.7, 0.1, 0.25, 0.25])]
+            axes += energy_axes
+        else:
+            ax.set_position([0.1, 0.25, 0.8, 0.8])
+        for i in axes:
+            i.set_facecolor(BACKGROUND)
+        ax.set_aspect('equal', 'box')
+        ax2.set_aspect('equal', 'box')
+
+        n = len(trajectory.masses)
+        colors = params.get('colors', COLORS)
+        sizes = [float(params.get(f'tb_radius{i}', 2)) * 100 for i in range(1, n + 1)]
+        cog_size = float(params.get('tb_radius_cog', 1)) * 100
+        count = trajectory.available
+
+        self.views = [OrbitView(ax), OrbitView(ax2)]
+        self.views[0].setup([trajectory.r_sol[:, i] for i in range(n)], colors, sizes,
+                            trajectory.cog_sol, colors[3], cog_size, origins=True, count=count)
+        self.views[1].setup([trajectory.t_sol[:, i] for i in range(n)], colors, sizes,
+                            trajectory.cog_sol_t, colors[3], cog_size, count=count)
+        for view in self.views:
+            view.set_style(True, False, False, False)
+            view.set_trail_mode(trail)
+
+        if energy:
+            series = [trajectory.KE[:, 0], trajectory.KE[:, 1], trajectory.totalE]
+            for i, fmt, values in zip(energy_axes, ['r', 'b', 'g'], series):
+                view = EnergyView(i, fmt)
+                view.setup(values, count=count)
+                self.views.append(view)
+
+        self.blitManager = BlitManager(self.canvas, self.views)
+        self.blitManager.set_enabled(True)
+        self.canvas.draw()
+
+    @property
+    def size(self):
+        return self.canvas.get_width_height()
+
+    def render(self, num):
+        """RGBA pixels of the frame showing sample num, valid until the next call."""
+        for view in self.views:
+            view.update(num)
+        self.blitManager.update()
+        return self.canvas.buffer_rgba()
+
+
+def open_run(path):
+    """A run file or a run directory, returns (trajectory, params)."""
+    if os.path.isdir(path):
+        return store.load(path), {}
+    return runfile.load(path)
+
+
+def frame_samples(available, frames=None):
+    """Sample shown by every frame, `frames` of them spread evenly over the run."""
+    if frames is None or frames >= available:
+        return np.arange(available)
+    return np.linspace(0, available - 1, frames).round().astype(int)
+
+
+def image_pattern(output):
+    # orbit.png becomes orbit_00000.png, orbit_00001.png, ...
+    if '%' in output:
+        return output
+    root, ext = os.path.splitext(output)
+    return root + '_%05d' + ext
+
+
+def ffmpeg(arguments):
+    try:
+        return subprocess.Popen(['ffmpeg', '-y', '-loglevel', 'error'] + arguments,
+                                stdin=subprocess.PIPE, stderr=subprocess.PIPE)
+    except FileNotFoundError:
+        raise RuntimeError('ffmpeg was not found, install it or export images, e.g. frames/orbit_%05d.png') from None
+
+
+def finish(process):
+    _, error = process.communicate()
+    if process.returncode != 0:
+        raise RuntimeError('ffmpeg failed: ' + error.decode(errors='replace').strip())
+
+
+def render_range(job):
+    """Render one range of frames, in a worker process. Returns its frame count."""
+    trajectory, params = open_run(job['run'])
+    scene = Scene(trajectory, params, **job['scene'])
+    samples = job['samples']
+
+    if job['kind'] == 'images':
+        for frame, num in enumerate(samples, job['first']):
+            image = Image.frombuffer('RGBA', scene.size, scene.render(num), 'raw', 'RGBA', 0, 1)
+            image.convert('RGB').save(job['target'] % frame)
+        return len(samples)
+
+    width, height = scene.size
+    process = ffmpeg(['-f', 'rawvideo', '-pix_fmt', 'rgba', '-s', f'{width}x{height}', '-r', str(job['fps']),
+                      '-i', '-'] + job['codec'] + [job['target']])
+    try:
+        for num in samples:
+            process.stdin.write(scene.render(num))
+    except BrokenPipeError:
+        pass
+    finish(process)
+    return len(samples)
+
+
+def export(run, output, frames=None, fps=60, width=1280, height=720, dpi=100, energy=False, trail='full',
+           workers=None, progress=None):
+    """Render the run at path `run` to `output`, a video or an image pattern.
+
+    workers defaults to the number of cores. progress(done, total) is called
+    as frame ranges finish.
+    """
+    trajectory, _ = open_run(run)
+    samples = frame_samples(trajectory.available, frames)
+    workers = workers or os.cpu_count()
+    ext = os.path.splitext(output)[1].lower()
+
+    if ext not in IMAGES and ext not in CODECS:
+        raise ValueError(f'Unknown output format {ext!r}, use one of {", ".join(IMAGES + tuple(CODECS))}')
+    # yuv420p needs even dimensions
+    width, height = width + width % 2, height + height % 2
+    scene = dict(width=width, height=height, dpi=dpi, energy=energy, trail=trail)
+
+    # A few ranges per worker even out their speed, each range renders
+    # the background and reads the run once
+    ranges = np.array_split(np.arange(len(samples)), min(len(samples), 4 * workers))
+    jobs = [dict(run=run, scene=scene, samples=samples[i], first=int(i[0]), fps=fps) for i in ranges]
+
+    segments = None
+    if ext in IMAGES:
+        pattern = image_pattern(output)
+        os.makedirs(os.path.dirname(pattern) or '.', exist_ok=True)
+        for job in jobs:
+            job.update(kind='images', target=pattern)
+    else:
+        segments = tempfile.mkdtemp(prefix='export-', dir=os.path.dirname(os.path.abspath(output)))
+        for k, job in enumerate(jobs):
+            job.update(kind='video', codec=CODECS[ext],
+                       target=os.path.join(segments, f'segment_{k:05d}{SEGMENT.get(ext, ext)}'))
+
+    try:
+        done = 0
+        if workers == 1:
+            for job in jobs:
+                done += render_range(job)
+                if progress is not None:
+                    progress(done, len(samples))
+        else:
+            with ProcessPoolExecutor(max_workers=workers) as pool:
+                for future in as_completed([pool.submit(render_range, job) for job in jobs]):
+                    done += future.result()
+                    if progress is not None:
+                        progress(done, len(samples))
+
+        if segments is not None:
+            join(jobs, segments, output, ext)
+    finally:
+        if segments is not None:
+            shutil.rmtree(segments, ignore_errors=True)
+
+    return len(samples)
+
+
+def join(jobs, segments, output, ext):
+    listing = os.path.join(segments, 'segments.txt')
+    with open(listing, 'w') as f:
+        for job in jobs:
+            f.write("file '{}'\n".format(job['target'].replace("'", r"'\''")))
+
+    if ext == '.gif':
+        codec = ['-filter_complex', 'split[a][b];[a]palettegen[p];[b][p]paletteuse']
+    else:
+        codec = ['-c', 'copy']
+    finish(ffmpeg(['-f', 'concat', '-safe', '0', '-i', listing] + codec + [output]))
+
+
+def parse_size(text):
+    width, height = text.lower().split('x')
+    return int(width), int(height)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Render the animation of a saved run without opening a window.')
+    parser.add_argument('run', help='run file (.npz) or run directory')
+    parser.add_argument('output', help='video (' + ', '.join(CODECS) + ') or image pattern, e.g. frames/orbit_%%05d.png')
+    parser.add_argument('--frames', type=int, help='number of frames spread over the run, defaults to every sample')
+    parser.add_argument('--fps', type=float, default=60, help='frames per second of the video')
+    parser.add_argument('--size', type=parse_size, default=(1280, 720), metavar='WxH', help='pixels, default 1280x720')
+    parser.add_argument('--dpi', type=float, default=100)
+    parser.add_argument('--energy', action='store_true', help='also show the energy plots')
+    parser.add_argument('--fading-trail', action='store_true', help='only show the recent part of the trails')
+    parser.add_argument('--workers', type=int, help='worker processes, defaults to the number of cores')
+    args = parser.parse_args(argv)
+
+    def progress(done, total):
+        print(f'\r{done}/{total} frames', end='', file=sys.stderr)
+
+    count = export(args.run, args.output, frames=args.frames, fps=args.fps, width=args.size[0],
+                   height=args.size[1], dpi=args.dpi, energy=args.energy,
+                   trail='fade' if args.fading_trail else 'full', workers=args.workers, progress=progress)
+    print(file=sys.stderr)
+    print(f'Wrote {count} frames to {args.output}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,97 @@
+"""Wall-clock driven playback of a computed trajectory.
+
+The animation used to advance a fixed number of samples per timer tick, so
+the playback speed depended on how long a frame took to draw. PlaybackClock
+instead maps elapsed wall-clock time to a simulated time and looks up the
+matching index in the time grid, skipping samples when drawing falls behind.
+"""
+import time
+
+import numpy as np
+
+
+class PlaybackClock:
+    def __init__(self, fps=60, speed=1000, clock=time.perf_counter):
+        self.fps = fps
+        # Samples of the time grid played per wall-clock second
+        self.speed = speed
+        self.clock = clock
+
+        self.t = np.zeros(1)
+        # Only the first `available` samples of t may be played. While a run
+        # is incomplete playback waits at its end instead of looping.
+        self.available = 1
+        self.complete = True
+        self.step = 1.0
+        self.sim_time = 0.0
+        self.num = 0
+        self.last = self.clock()
+
+        self.draw_time = 0.0
+        self.skipped = 0
+
+    def set_times(self, t):
+        self.t = np.asarray(t)
+        if len(self.t) > 1:
+            self.step = (self.t[-1] - self.t[0]) / (len(self.t) - 1)
+        self.available = len(self.t)
+        self.complete = True
+        self.reset()
+
+    def set_available(self, available, complete=True):
+        self.available = max(available, 1)
+        self.complete = complete
+
+    def reset(self, num=0):
+        self.num = num
+        self.sim_time = self.t[num]
+        self.last = self.clock()
+        self.skipped = 0
+
+    def set_speed(self, speed):
+        self.speed = speed
+
+    def set_fps(self, fps):
+        self.fps = fps
+
+    # Called instead of tick while paused so no time accumulates
+    def hold(self):
+        self.last = self.clock()
+
+    def tick(self):
+        now = self.clock()
+        self.sim_time += (now - self.last) * self.speed * self.step
+        self.last = now
+
+        # Past the last available sample, the grid may also run backwards in time
+        if (self.sim_time - self.t[self.available - 1]) * self.step > 0:
+            if not self.complete:
+                self.sim_time = self.t[self.available - 1]
+                self.num = self.available - 1
+                return self.num
+            self.sim_time = self.t[0]
+            self.num = 0
+            return self.num
+
+        if self.step >= 0:
+            num = int(np.searchsorted(self.t[: self.available], self.sim_time, side='right')) - 1
+        else:
+            # Count the samples at or before sim_time in a decreasing grid from its reversed view
+            ahead = int(np.searchsorted(self.t[self.available - 1 :: -1], self.sim_time, side='left'))
+            num = self.available - ahead - 1
+        num = min(max(num, 0), self.available - 1)
+        self.skipped += max(num - self.num - 1, 0)
+        self.num = num
+        return self.num
+
+    def frame_drawn(self, seconds):
+        # Smooth the measured draw time so one slow frame does not stall the timer
+        self.draw_time = 0.8 * self.draw_time + 0.2 * seconds
+
+    def interval(self):
+        """Timer interval in milliseconds.
+
+        Aims at the target frame rate but never schedules ticks faster than
+        frames can be drawn, leaving some headroom for Qt to process events.
+        """
+        return max(int(1000 / self.fps), int(1250 * self.draw_time))
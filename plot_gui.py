@@ -6,10 +6,12 @@ import matplotlib.pyplot as plt
 from matplotlib.backends.backend_qt5agg import FigureCanvasQTAgg as FigureCanvas
 from matplotlib.figure import Figure
 from matplotlib.animation import TimedAnimation, FuncAnimation
-from scipy.integrate import odeint
 
 import numpy as np
 
+from renderer import OrbitView
+from simulation import G, simulate
+
 stylesheet = '''
 
 #TimeProgressBar {
@@ -56,6 +58,7 @@ class MainWindow(QMainWindow):
         self.layout = QHBoxLayout(self._main)
         self.ax = self.fig.add_subplot(111, projection='3d')
         self.ax.set_aspect('equal', 'box')
+        self.orbitView = OrbitView(self.ax)
     
 
         # self.ax.w_xaxis.set_pane_color((0.75, 0.5, 0.3, 1))
@@ -71,27 +74,43 @@ class MainWindow(QMainWindow):
         self.tb_cog_col_preview.setStyleSheet("background: {}".format(self.tb_cog_col))
         self.plot_face_color_preview.setStyleSheet("background: {}".format("#FFFFFF"))
 
-        
-        self.ax.set_xticklabels([])
-        self.ax.set_yticklabels([])
-        self.ax.set_zticklabels([])
-        self.ax.set_axis_off()
-        self.ax.grid(False)
 
         self.timer = QtCore.QTimer()
         self.timer.setInterval(10)
         self.timer.timeout.connect(self.animate_func)
         self.init_vals()
         self.calc()
+        self.initArtists()
+
+    def initArtists(self):
+        self.orbitView.setup([self.r1_sol, self.r2_sol], [self.tb_col1, self.tb_col2], [self.radius1 * 100, self.radius2 * 100],
+                             self.cog_sol, self.tb_cog_col, 100, origins=True)
+        self.apply_visibility()
+        self.apply_axes_style()
+        self.orbitView.update(self.num)
+
+    # Styling is only touched when a toggle changes, not every frame
+    def apply_axes_style(self):
+        self.orbitView.set_style(self.axes_shown, self.axes_ticks_shown, self.grid_shown, self.grid_labels_shown)
+
+    def apply_visibility(self):
+        self.orbitView.set_visibility(self.trace_shown, self.cog_shown, self.origin_shown)
+        self.orbitView.update(self.num)
+
+    def apply_colors(self):
+        self.orbitView.set_colors([self.tb_col1, self.tb_col2], self.tb_cog_col)
 
     def toggle_cog(self):
         self.cog_shown = not self.cog_shown
+        self.apply_visibility()
 
     def toggle_trace(self):
         self.trace_shown = not self.trace_shown
+        self.apply_visibility()
 
     def toggle_origin(self):
         self.origin_shown = not self.origin_shown
+        self.apply_visibility()
             
     def toggle_axes(self):
         self.axes_shown = not self.axes_shown
@@ -103,6 +122,7 @@ class MainWindow(QMainWindow):
             self.axes_tick_box.setEnabled(False)
             self.grid_labels_box.setEnabled(False)
             self.grid_box.setEnabled(False)
+        self.apply_axes_style()
 
 
     def toggle_axes_ticks(self):
@@ -113,6 +133,7 @@ class MainWindow(QMainWindow):
         else:
             self.grid_box.setEnabled(False)
             self.grid_labels_box.setEnabled(False)
+        self.apply_axes_style()
 
     def toggle_grid(self):
         self.grid_shown = not self.grid_shown
@@ -120,9 +141,11 @@ class MainWindow(QMainWindow):
             self.grid_labels_box.setEnabled(True)
         else:
             self.grid_labels_box.setEnabled(False)
+        self.apply_axes_style()
 
     def toggle_grid_labels(self):
         self.grid_labels_shown = not self.grid_labels_shown
+        self.apply_axes_style()
 
     def anim_toggle(self):
         self.paused = not self.paused
@@ -140,39 +163,7 @@ class MainWindow(QMainWindow):
             
             self.timeProgressbar.setValue(abs(self.num))
             self.timeValue.setText("{} s".format(str(self.t[self.num])))
-            self.ax.cla()
-
-            if self.cog_shown:
-                self.ax.scatter(self.cog_sol[self.num, 0], self.cog_sol[self.num, 1], self.cog_sol[self.num, 2], c=self.tb_cog_col, marker='o', s=100)
-
-            if self.trace_shown:
-                self.ax.plot3D(self.r1_sol[: self.num + 1, 0], self.r1_sol[: self.num + 1, 1], self.r1_sol[: self.num + 1, 2], c = self.tb_col1)
-                self.ax.plot3D(self.r2_sol[: self.num + 1, 0], self.r2_sol[: self.num + 1, 1], self.r2_sol[: self.num + 1, 2], c = self.tb_col2)
-
-            self.ax.scatter(self.r1_sol[self.num, 0], self.r1_sol[self.num, 1], self.r1_sol[self.num, 2], c= self.tb_col1, marker='o', s=self.radius1 * 100)
-
-            self.ax.scatter(self.r2_sol[self.num, 0], self.r2_sol[self.num, 1], self.r2_sol[self.num, 2], c=self.tb_col2, marker='o', s=self.radius2 * 100)
-
-            if self.origin_shown:
-                self.ax.scatter(self.r1_sol[0, 0], self.r1_sol[0, 1], self.r1_sol[0, 2], c='black', marker='o', s=50)
-                self.ax.scatter(self.r2_sol[0, 0], self.r2_sol[0, 1], self.r2_sol[0, 2], c='black', marker='o', s=50)
-
-            if not self.grid_shown:
-                self.ax.grid(False)
-
-            if not self.axes_shown:
-                self.ax.set_axis_off()
-
-            if not self.grid_labels_shown:
-                self.ax.set_xticklabels([])
-                self.ax.set_yticklabels([])
-                self.ax.set_zticklabels([])
-            
-            if not self.axes_ticks_shown:
-                self.ax.set_xticks([])
-                self.ax.set_yticks([])
-                self.ax.set_zticks([])
-
+            self.orbitView.update(self.num)
             self.canvas.draw()
 
     # Function for starting and stopping animation
@@ -182,7 +173,7 @@ class MainWindow(QMainWindow):
         self.get_inputs()
         self.calc()
         self.num = 0
-        self.ax.cla()
+        self.initArtists()
     
     # Function for getting the inputs from lineedits
     def get_inputs(self):
@@ -440,50 +431,36 @@ class MainWindow(QMainWindow):
         #self.tb_col1_preview.setText(cd.name())
         self.tb_cog_col = cd.name()
         self.tb_cog_col_preview.setStyleSheet("background: {}".format(cd.name()))
+        self.apply_colors()
 
     def get_col1(self):
         cd = QColorDialog().getColor()
         #self.tb_col1_preview.setText(cd.name())
         self.tb_col1 = cd.name()
         self.tb_col1_preview.setStyleSheet("background: {}".format(cd.name()))
+        self.apply_colors()
 
     def get_col2(self):
         cd = QColorDialog().getColor()
         #self.tb_col1_preview.setText(cd.name())
         self.tb_col2 = cd.name()
         self.tb_col2_preview.setStyleSheet("background: {}".format(cd.name()))
+        self.apply_colors()
 
     def init_vals(self):
         self.get_inputs()
-        self.G = 6.6743e-20 # km^3 kg^(-1)s^(-2)
-
-    # Model function
-    def TwoBodyProblem(self, y, t, G, m1, m2):
-        r1 = y[: 3]
-        r2 = y[3 : 6]
-
-        v1 = y[6 : 9]
-        v2 = y[9 : 12]
-
-        r = np.linalg.norm(r2 - r1)
-
-        c0 = y[6 : 12]
-        c1 = G * m2 * ((r2 - r1)/np.power(r, 3))
-        c2 = G * m1 * ((r1 - r2)/np.power(r, 3))
-
-        return np.concatenate((c0, c1, c2))
+        self.G = G
 
     def calc(self):
         self.T = len(self.t)
         self.timeProgressbar.setMaximum(2 * int(self.timef.text()))
-        y0 = np.concatenate((self.r1, self.r2, self.v1, self.v2))
-        y = odeint(self.TwoBodyProblem, y0, self.t, args=(self.G, self.m1, self.m2))
+        sim = simulate([self.m1, self.m2], [self.r1, self.r2], [self.v1, self.v2], self.t, G=self.G)
 
-        self.r1_sol = y[:, :3]
-        self.r2_sol = y[:, 3: 6]
+        self.r1_sol = sim.r_sol[:, 0]
+        self.r2_sol = sim.r_sol[:, 1]
 
         # Center of mass
-        self.cog_sol = (self.m1 * self.r1_sol + self.m2 * self.r2_sol)/(self.m1 + self.m2)
+        self.cog_sol = sim.cog_sol
 
 
 
@@ -1,16 +1,25 @@
+import os
 import sys
+import tempfile
+import time
 from PyQt6 import QtWidgets, QtCore, QtGui
-from PyQt6.QtCore import Qt
-from PyQt6.QtWidgets import QApplication, QVBoxLayout, QPushButton, QHBoxLayout, QCheckBox, QLineEdit, QGroupBox, QGridLayout, QLabel, QColorDialog, QSplitter, QComboBox, QMenuBar, QMenu, QSizePolicy, QProgressBar, QWidget, QMainWindow, QScrollArea, QSlider, QMessageBox, QFrame
+from PyQt6.QtCore import Qt, QObject, QThread, pyqtSignal
+from PyQt6.QtWidgets import QApplication, QVBoxLayout, QPushButton, QHBoxLayout, QCheckBox, QLineEdit, QGroupBox, QGridLayout, QLabel, QColorDialog, QSplitter, QComboBox, QMenuBar, QMenu, QSizePolicy, QProgressBar, QWidget, QMainWindow, QScrollArea, QSlider, QMessageBox, QFrame, QSpinBox, QFileDialog
 from PyQt6.QtGui import QAction, QShortcut, QKeySequence
 import matplotlib.pyplot as plt
 from matplotlib.backends.backend_qt5agg import FigureCanvasQTAgg as FigureCanvas
 from matplotlib.figure import Figure
 from matplotlib.animation import TimedAnimation, FuncAnimation
-from scipy.integrate import odeint
 
 import numpy as np
 
+from renderer import OrbitView, EnergyView, BlitManager
+from playback import PlaybackClock
+from profiling import Profiler
+from simulation import G, METHODS, simulate, stream
+from simulation import runfile
+from simulation.cache import TrajectoryCache, run_key
+
 app_stylesheet = '''
 
 #TimeProgressBar {
@@ -22,6 +31,13 @@ QWidget {
         }
 '''
 
+# Finished runs are kept here when "Keep runs on disk" is checked
+CACHE_DIR = os.path.join(os.path.expanduser("~"), ".cache", "two-body-problem-gui")
+
+# Runs whose states take more bytes than this are integrated into memory
+# mapped files in a temporary directory instead of RAM
+MEMORY_LIMIT = 1 << 30
+
 msgbox_stylesheet = '''
 font-family: Rajdhani Semibold;
 font-size: 24px;
@@ -52,6 +68,60 @@ class Line(QFrame):
         self.setStyleSheet(line_stylesheet)
         self.setFrameShadow(QFrame.Shadow.Sunken)
 
+class SimulationWorker(QObject):
+    """Streams a simulation on a QThread, reporting the integrated chunks.
+
+    Consecutive chunks are reported together when they finish faster than
+    report_interval seconds apart, so short chunks do not flood the GUI.
+    """
+
+    chunkReady = pyqtSignal(object, int)
+    failed = pyqtSignal(str)
+    finished = pyqtSignal()
+
+    report_interval = 0.05
+
+    def __init__(self, inputs, t, G, options, profiler = None, parent = None):
+        super(SimulationWorker, self).__init__(parent)
+        self.inputs = inputs
+        self.t = t
+        self.G = G
+        self.options = options
+        self.profiler = profiler
+        self.cancelled = False
+        self.trajectory = None
+
+    def run(self):
+        try:
+            last = None
+            pending = None
+            start = time.perf_counter()
+            for pending in stream(*self.inputs, self.t, G = self.G, **self.options):
+                if self.cancelled:
+                    return
+                self.trajectory = pending[0]
+                now = time.perf_counter()
+                if self.profiler is not None:
+                    self.profiler.add("integrate chunk", start, now, "worker")
+                start = now
+                if last is None or now - last > self.report_interval:
+                    self.chunkReady.emit(*pending)
+                    pending = None
+                    last = now
+
+            # The last chunk is always reported, also when a collision ended the run early
+            if pending is not None:
+                self.chunkReady.emit(*pending)
+        except Exception as e:
+            # Anything escaping a slot of the worker thread aborts the application,
+            # large runs also fail with OSError (disk full) or MemoryError
+            self.failed.emit(str(e) or type(e).__name__)
+        finally:
+            self.finished.emit()
+
+    def cancel(self):
+        self.cancelled = True
+
 class PreferencesDialog(QMainWindow):
     def __init__(self, parent=None):
         super(PreferencesDialog, self).__init__(parent)
@@ -74,6 +144,8 @@ class MainWindow(QMainWindow):
         self.grid_shown = False
         self.grid_labels_shown = False
         self.energy_plot_shown = False
+        self.blit_enabled = True
+        self.fading_trail = False
         self.tb_col1 = "#FF5000"
         self.tb_col2 = "#563843"
         self.tb_col3 = "#456753"
@@ -81,7 +153,22 @@ class MainWindow(QMainWindow):
         self.plot_bg_color = "#989898"
         self.time = 0
         self.anim_speed = 10
+        self.target_fps = 60
         self.three_body_mode = False
+        self.worker = None
+        self.worker_thread = None
+        self.computing = False
+        self.disk_cache = False
+        self.cache = TrajectoryCache()
+        self.simulation_key = None
+        self.scratch = None
+        self.run_params = {}
+        self.profiler = Profiler()
+        self.profile_shown = 0.0
+        self.simulation_started = 0.0
+
+        # The nominal speed is anim_speed samples every 10 ms
+        self.clock = PlaybackClock(fps=self.target_fps, speed=self.anim_speed * 100)
 
         self.setMinimumSize(800, 400)
         self.setStyleSheet(app_stylesheet)
@@ -108,41 +195,21 @@ class MainWindow(QMainWindow):
         self.tb_cog_col_preview.setStyleSheet("background: {}".format(self.tb_cog_col))
         self.plot_face_color_preview.setStyleSheet("background: {}".format(self.plot_bg_color))
 
-        self.ax.set_xticklabels([])
-        self.ax.set_yticklabels([])
-        self.ax.set_zticklabels([])
-        self.ax.set_axis_off()
-        self.ax.grid(False)
         self.ax.set_title("Non-inertial frame of reference")
-
-        self.ax2.set_xticklabels([])
-        self.ax2.set_yticklabels([])
-        self.ax2.set_zticklabels([])
-        self.ax2.set_axis_off()
-        self.ax2.grid(False)
         self.ax2.set_title("Center of Gravity frame of reference", x = .7, y = -0.1)
 
         self.timer = QtCore.QTimer()
-        self.timer.setInterval(10)
+        self.timer.setInterval(self.clock.interval())
         self.timer.timeout.connect(self.animate_func)
 
         self.timer_three_body = QtCore.QTimer()
-        self.timer_three_body.setInterval(10)
+        self.timer_three_body.setInterval(self.clock.interval())
         self.timer_three_body.timeout.connect(self.animate_three_body_func)
 
 
         self.init_vals()
         self.calc()
-
-
-        self.ax3.set_xlim(0, self.xmax)
-        self.ax4.set_xlim(0, self.xmax)
-        self.ax5.set_xlim(0, self.xmax)
-
-        self.ax4.set_ylim(self.ymin2, self.ymax2)
-        self.ax3.set_ylim(self.ymin1, self.ymax1)
-        self.ax5.set_ylim(self.ymin3, self.ymax3)
-
+        self.initArtists()
 
         self.show()
 
@@ -159,6 +226,15 @@ class MainWindow(QMainWindow):
         self.plotList = [self.ax, self.ax2, self.ax3, self.ax4, self.ax5]
         self.energyPlotAxesList = [self.ax3, self.ax4, self.ax5]
 
+        # Artists are created once per run and only updated every frame
+        self.orbitView = OrbitView(self.ax)
+        self.cogView = OrbitView(self.ax2)
+        self.orbitViewList = [self.orbitView, self.cogView]
+        self.energyViewList = [EnergyView(self.ax3, 'r'), EnergyView(self.ax4, 'b'), EnergyView(self.ax5, 'g')]
+
+        self.blitManager = BlitManager(self.canvas, self.orbitViewList + self.energyViewList)
+        self.blitManager.set_enabled(self.blit_enabled)
+
         self.ax.set_aspect('equal', 'box')
         self.ax2.set_aspect('equal', 'box')
         #self.ax3.set_aspect('equal', 'box')
@@ -182,14 +258,76 @@ class MainWindow(QMainWindow):
 
         self.fig.set_facecolor(self.plot_bg_color)
 
+    def initArtists(self):
+        if self.three_body_mode:
+            inertial = [self.r1_sol, self.r2_sol, self.r3_sol]
+            cog_frame = [self.t1_sol, self.t2_sol, self.t3_sol]
+            sizes = [self.radius1, self.radius2, self.radius3]
+        else:
+            inertial = [self.r1_sol, self.r2_sol]
+            cog_frame = [self.t1_sol, self.t2_sol]
+            sizes = [self.radius1, self.radius2]
+
+        colors = [self.tb_col1, self.tb_col2, self.tb_col3]
+
+        available = self.sim.available
+        self.orbitView.setup(inertial, colors, sizes, self.cog_sol, self.tb_cog_col, self.radius_cog, origins=True, count=available)
+        self.cogView.setup(cog_frame, colors, sizes, self.cog_sol_t, self.tb_cog_col, self.radius_cog, count=available)
+
+        for i, series in zip(self.energyViewList, [self.KE1, self.KE2, self.totalE]):
+            i.setup(series, count=available)
+
+        self.apply_visibility()
+        self.apply_axes_style()
+        self.update_artists()
+
+    def update_artists(self):
+        with self.profiler.phase("orbits"):
+            for i in self.orbitViewList:
+                i.update(self.num)
+
+        if self.energy_plot_shown:
+            with self.profiler.phase("energy"):
+                for i in self.energyViewList:
+                    i.update(self.num)
+
+    # Styling is only touched when a toggle changes, not every frame
+    def apply_axes_style(self):
+        for i in self.orbitViewList:
+            i.set_style(self.axes_shown, self.axes_ticks_shown, self.grid_shown, self.grid_labels_shown)
+
+    def apply_visibility(self):
+        for i in self.orbitViewList:
+            i.set_visibility(self.trace_shown, self.cog_shown, self.origin_shown)
+
+    def apply_colors(self):
+        colors = [self.tb_col1, self.tb_col2, self.tb_col3]
+        for i in self.orbitViewList:
+            i.set_colors(colors, self.tb_cog_col)
+        self.canvas.draw_idle()
+
     def toggle_cog(self):
         self.cog_shown = not self.cog_shown
+        self.apply_visibility()
+        self.canvas.draw_idle()
 
     def toggle_trace(self):
         self.trace_shown = not self.trace_shown
+        self.apply_visibility()
+        self.update_artists()
+        self.canvas.draw_idle()
+
+    def toggle_fading_trail(self):
+        self.fading_trail = self.view_fading_trail_action.isChecked()
+        for i in self.orbitViewList:
+            i.set_trail_mode("fade" if self.fading_trail else "full")
+        self.update_artists()
+        self.canvas.draw_idle()
 
     def toggle_origin(self):
         self.origin_shown = not self.origin_shown
+        self.apply_visibility()
+        self.canvas.draw_idle()
 
     def toggle_axes(self):
         self.axes_shown = not self.axes_shown
@@ -202,6 +340,7 @@ class MainWindow(QMainWindow):
             self.grid_labels_box.setEnabled(False)
             self.grid_box.setEnabled(False)
 
+        self.apply_axes_style()
         self.canvas.draw()
 
 
@@ -214,6 +353,7 @@ class MainWindow(QMainWindow):
             self.grid_box.setEnabled(False)
             self.grid_labels_box.setEnabled(False)
 
+        self.apply_axes_style()
         self.canvas.draw()
 
     def toggle_grid(self):
@@ -222,10 +362,12 @@ class MainWindow(QMainWindow):
             self.grid_labels_box.setEnabled(True)
         else:
             self.grid_labels_box.setEnabled(False)
+        self.apply_axes_style()
         self.canvas.draw()
 
     def toggle_grid_labels(self):
         self.grid_labels_shown = not self.grid_labels_shown
+        self.apply_axes_style()
         self.canvas.draw()
 
     def anim_toggle(self):
@@ -237,192 +379,158 @@ class MainWindow(QMainWindow):
         self.canvas.draw()
 
     def animate_func(self):
-        if not self.paused:
-            if self.num + self.anim_speed < self.T - 1:
-                self.num += self.anim_speed
-            else:
-                self.num = 0
-
-            self.timeProgressbar.setValue(abs(self.num))
-            self.timeValue.setText("{} s".format(str(self.t[self.num])))
-            self.ax.cla()
-            self.ax2.cla()
-
-            if self.energy_plot_shown:
-                self.ax3.cla()
-                self.ax4.cla()
-                self.ax5.cla()
-                self.ax3.plot(self.KE1[: self.num + 1],'r', markersize=1)
-                self.ax4.plot(self.KE2[: self.num + 1],'b', markersize=1)
-                self.ax5.plot(self.totalE[: self.num + 1],'g', markersize=1)
-
-            # Energy plot
-            # self.ax3.plot(self.num, self.v1_res[self.num],'.b')
-            # self.ax3.plot(self.num, self.v2_res[self.num],'.r')
-
-            if self.cog_shown:
-                self.ax.scatter(self.cog_sol[self.num, 0], self.cog_sol[self.num, 1], self.cog_sol[self.num, 2], c=self.tb_cog_col, marker='o', s=self.radius_cog)
-                self.ax2.scatter(self.cog_sol_t[self.num, 0], self.cog_sol_t[self.num, 1], self.cog_sol_t[self.num, 2], c=self.tb_cog_col, marker='o', s=self.radius_cog)
-
-            if self.trace_shown:
-                self.ax.plot3D(self.r1_sol[: self.num + 1, 0], self.r1_sol[: self.num + 1, 1], self.r1_sol[: self.num + 1, 2], c = self.tb_col1)
-                self.ax.plot3D(self.r2_sol[: self.num + 1, 0], self.r2_sol[: self.num + 1, 1], self.r2_sol[: self.num + 1, 2], c = self.tb_col2)
-
-                self.ax2.plot3D(self.t1_sol[: self.num + 1, 0], self.t1_sol[: self.num + 1, 1], self.t1_sol[: self.num + 1, 2], c = self.tb_col1)
-                self.ax2.plot3D(self.t2_sol[: self.num + 1, 0], self.t2_sol[: self.num + 1, 1], self.t2_sol[: self.num + 1, 2], c = self.tb_col2)
-
-            self.ax.scatter(self.r1_sol[self.num, 0], self.r1_sol[self.num, 1], self.r1_sol[self.num, 2], c= self.tb_col1, marker='o', s=self.radius1)
-            self.ax.scatter(self.r2_sol[self.num, 0], self.r2_sol[self.num, 1], self.r2_sol[self.num, 2], c=self.tb_col2, marker='o', s=self.radius2)
-
-            self.ax2.scatter(self.t1_sol[self.num, 0], self.t1_sol[self.num, 1], self.t1_sol[self.num, 2], c= self.tb_col1, marker='o', s=self.radius1)
-            self.ax2.scatter(self.t2_sol[self.num, 0], self.t2_sol[self.num, 1], self.t2_sol[self.num, 2], c=self.tb_col2, marker='o', s=self.radius2)
-
-            if self.origin_shown:
-                self.ax.scatter(self.r1_sol[0, 0], self.r1_sol[0, 1], self.r1_sol[0, 2], c='black', marker='o', s=50)
-                self.ax.scatter(self.r2_sol[0, 0], self.r2_sol[0, 1], self.r2_sol[0, 2], c='black', marker='o', s=50)
-
-            if not self.grid_shown:
-                self.ax.grid(False)
-                self.ax2.grid(False)
+        if self.paused:
+            self.clock.hold()
+            return
 
-            if not self.axes_shown:
-                self.ax.set_axis_off()
-                self.ax2.set_axis_off()
+        start = time.perf_counter()
+        with self.profiler.phase("tick"):
+            self.num = self.clock.tick()
 
-            if not self.grid_labels_shown:
-                self.ax.set_xticklabels([])
-                self.ax.set_yticklabels([])
-                self.ax.set_zticklabels([])
-                self.ax2.set_xticklabels([])
-                self.ax2.set_yticklabels([])
-                self.ax2.set_zticklabels([])
+        with self.profiler.phase("labels"):
+            # While integrating the progress bar shows the integration instead
+            if not self.computing:
+                self.timeProgressbar.setValue(abs(self.num))
+            self.timeValue.setText("{} s".format(str(self.t[self.num])))
 
-            if not self.axes_ticks_shown:
-                self.ax.set_xticks([])
-                self.ax.set_yticks([])
-                self.ax.set_zticks([])
+        self.update_artists()
+        with self.profiler.phase("draw"):
+            self.blitManager.update()
 
-                self.ax2.set_xticks([])
-                self.ax2.set_yticks([])
-                self.ax2.set_zticks([])
+        self.clock.frame_drawn(time.perf_counter() - start)
+        self.update_timer_interval()
+        self.profiler.frame_done()
+        self.show_profile()
 
+    # A few updates per second are plenty and keep the label out of the timings
+    def show_profile(self):
+        now = time.perf_counter()
+        if self.profiler.enabled and now - self.profile_shown > 0.25:
+            self.profileValue.setText(self.profiler.summary())
+            self.profile_shown = now
 
-            self.canvas.draw()
+    def update_timer_interval(self):
+        interval = self.clock.interval()
+        if interval != self.timer.interval():
+            self.timer.setInterval(interval)
+            self.timer_three_body.setInterval(interval)
 
     def animate_three_body_func(self):
-        if not self.paused:
-            if self.num + self.anim_speed < self.T - 1:
-                self.num += self.anim_speed
-            else:
-                self.num = 0
-
-            self.timeProgressbar.setValue(abs(self.num))
-            self.timeValue.setText("{} s".format(str(self.t[self.num])))
-            self.ax.cla()
-            self.ax2.cla()
-            
-
-            if self.cog_shown:
-                self.ax.scatter(self.cog_sol[self.num, 0], self.cog_sol[self.num, 1], self.cog_sol[self.num, 2], c=self.tb_cog_col, marker='o', s=self.radius_cog)
-                self.ax2.scatter(self.cog_sol_t[self.num, 0], self.cog_sol_t[self.num, 1], self.cog_sol_t[self.num, 2], c=self.tb_cog_col, marker='o', s=self.radius_cog)
-
-            if self.trace_shown:
-                self.ax.plot3D(self.r1_sol[: self.num + 1, 0], self.r1_sol[: self.num + 1, 1], self.r1_sol[: self.num + 1, 2], c = self.tb_col1)
-                self.ax.plot3D(self.r2_sol[: self.num + 1, 0], self.r2_sol[: self.num + 1, 1], self.r2_sol[: self.num + 1, 2], c = self.tb_col2)
-                self.ax.plot3D(self.r3_sol[: self.num + 1, 0], self.r3_sol[: self.num + 1, 1], self.r3_sol[: self.num + 1, 2], c = self.tb_col3)
-
-                self.ax2.plot3D(self.t1_sol[: self.num + 1, 0], self.t1_sol[: self.num + 1, 1], self.t1_sol[: self.num + 1, 2], c = self.tb_col1)
-                self.ax2.plot3D(self.t2_sol[: self.num + 1, 0], self.t2_sol[: self.num + 1, 1], self.t2_sol[: self.num + 1, 2], c = self.tb_col2)
-                self.ax2.plot3D(self.t3_sol[: self.num + 1, 0], self.t3_sol[: self.num + 1, 1], self.t3_sol[: self.num + 1, 2], c = self.tb_col3)
-
-            self.ax.set_title("Non-inertial frame of reference")
-            self.ax.scatter(self.r1_sol[self.num, 0], self.r1_sol[self.num, 1], self.r1_sol[self.num, 2], c= self.tb_col1, marker='o', s=self.radius1)
-            self.ax.scatter(self.r2_sol[self.num, 0], self.r2_sol[self.num, 1], self.r2_sol[self.num, 2], c=self.tb_col2, marker='o', s=self.radius2)
-            self.ax.scatter(self.r3_sol[self.num, 0], self.r3_sol[self.num, 1], self.r3_sol[self.num, 2], c=self.tb_col3, marker='o', s=self.radius3)
-
-            self.ax2.scatter(self.t1_sol[self.num, 0], self.t1_sol[self.num, 1], self.t1_sol[self.num, 2], c= self.tb_col1, marker='o', s=self.radius1)
-            self.ax2.scatter(self.t2_sol[self.num, 0], self.t2_sol[self.num, 1], self.t2_sol[self.num, 2], c=self.tb_col2, marker='o', s=self.radius2)
-            self.ax2.scatter(self.t3_sol[self.num, 0], self.t3_sol[self.num, 1], self.t3_sol[self.num, 2], c=self.tb_col3, marker='o', s=self.radius3)
-            self.ax2.set_title("Center of Gravity frame of reference", x = .7, y = -0.1)
-
-            if self.origin_shown:
-                self.ax.scatter(self.r1_sol[0, 0], self.r1_sol[0, 1], self.r1_sol[0, 2], c='black', marker='o', s=50)
-                self.ax.scatter(self.r2_sol[0, 0], self.r2_sol[0, 1], self.r2_sol[0, 2], c='black', marker='o', s=50)
-                self.ax.scatter(self.r3_sol[0, 0], self.r3_sol[0, 1], self.r3_sol[0, 2], c='black', marker='o', s=50)
-
-            if not self.grid_shown:
-                self.ax.grid(False)
-                self.ax2.grid(False)
-
-            if not self.axes_shown:
-                self.ax.set_axis_off()
-                self.ax2.set_axis_off()
-
-            if not self.grid_labels_shown:
-                self.ax.set_xticklabels([])
-                self.ax.set_yticklabels([])
-                self.ax.set_zticklabels([])
-                self.ax2.set_xticklabels([])
-                self.ax2.set_yticklabels([])
-                self.ax2.set_zticklabels([])
-
-            if not self.axes_ticks_shown:
-                self.ax.set_xticks([])
-                self.ax.set_yticks([])
-                self.ax.set_zticks([])
-
-                self.ax2.set_xticks([])
-                self.ax2.set_yticks([])
-                self.ax2.set_zticks([])
-
-            self.canvas.draw()
+        # Both modes share the same persistent artists, see initArtists
+        self.animate_func()
 
     # Function for starting and stopping animation
     def anim_start_stop(self):
         self.anim_start_stop_button.setText("Reset Animation")
         self.get_inputs()
-        self.calc()
+        self.timer.stop()
+        self.timer_three_body.stop()
+        self.start_simulation()
+
+    # Integrate on a worker thread, the animation starts with the first chunk
+    def start_simulation(self):
+        self.cancel_simulation()
+
+        # Runs with the same inputs are only integrated once, changing colors,
+        # radii or toggles and pressing start again replays the stored result
+        self.simulation_key = self.simulation_cache_key()
+        self.run_params = self.run_parameters()
+        cached = self.cache.get(self.simulation_key)
+        if cached is not None:
+            self.start_playback(cached)
+            self.clock.set_available(self.available)
+            return
+
+        options = dict(self.simulation_options(), directory = self.scratch_directory())
+        self.worker = SimulationWorker(self.simulation_inputs(), self.t, self.G, options, self.profiler)
+        self.worker_thread = QThread()
+        self.worker.moveToThread(self.worker_thread)
+        self.worker_thread.started.connect(self.worker.run)
+        self.worker.chunkReady.connect(self.simulation_chunk)
+        self.worker.finished.connect(self.worker_thread.quit)
+        self.worker.failed.connect(self.simulation_failed)
+        self.worker.finished.connect(self.simulation_finished)
+
+        self.computing = True
+        self.timeProgressbar.setMaximum(len(self.t))
+        self.timeProgressbar.setValue(0)
+        self.timeProgressbar.setFormat("Integrating %p%")
+        self.simulation_started = time.perf_counter()
+        self.worker_thread.start()
+
+    def cancel_simulation(self):
+        if self.worker is not None:
+            self.worker.cancel()
+            self.worker_thread.quit()
+            self.worker_thread.wait()
+            self.worker = None
+            self.worker_thread = None
+        self.computing = False
+        self.timeProgressbar.setFormat("%p%")
+
+    def simulation_chunk(self, trajectory, available):
+        # Chunks of a cancelled run may still be queued
+        if self.sender() is not self.worker:
+            return
+
+        if getattr(self, "sim", None) is not trajectory:
+            self.start_playback(trajectory)
+        else:
+            grown = [i.autoscale(self.available, available) for i in self.orbitViewList]
+            grown += [i.autoscale(available) for i in self.energyViewList]
+            # Only a change of limits needs a full redraw, the new samples are
+            # picked up by the animation
+            if any(grown):
+                self.canvas.draw_idle()
+
+        self.available = available
+        self.clock.set_available(available, complete = available == len(self.t))
+        self.timeProgressbar.setValue(available)
+
+    def start_playback(self, trajectory):
+        self.set_trajectory(trajectory)
+        self.num = 0
+        self.clock.set_times(self.t)
+        self.initArtists()
         if not self.three_body_mode:
             self.timer.start()
         else:
             self.timer_three_body.start()
-        self.num = 0
-
-        self.ax.cla()
-        self.ax2.cla()
-        self.ax3.cla()
-        self.ax4.cla()
-        self.ax5.cla()
-
-        if self.paused:
-            if not self.grid_shown:
-                self.ax.grid(False)
-                self.ax2.grid(False)
-
-            if not self.axes_shown:
-                self.ax.set_axis_off()
-                self.ax2.set_axis_off()
-
-            if not self.grid_labels_shown:
-                self.ax.set_xticklabels([])
-                self.ax.set_yticklabels([])
-                self.ax.set_zticklabels([])
-                self.ax2.set_xticklabels([])
-                self.ax2.set_yticklabels([])
-                self.ax2.set_zticklabels([])
-
-            if not self.axes_ticks_shown:
-                self.ax.set_xticks([])
-                self.ax.set_yticks([])
-                self.ax.set_zticks([])
-
-                self.ax2.set_xticks([])
-                self.ax2.set_yticks([])
-                self.ax2.set_zticks([])
-
-            self.canvas.draw()
+        # Also grabs the blit backgrounds
+        self.canvas.draw_idle()
+
+    def simulation_finished(self):
+        if self.sender() is not self.worker:
+            return
+        self.computing = False
+        self.timeProgressbar.setFormat("%p%")
+        self.profiler.add("integration", self.simulation_started, time.perf_counter(), "simulation")
+
+        # Play whatever was computed, the run may have stopped on a collision
+        self.clock.set_available(self.available)
+
+        trajectory = self.worker.trajectory
+        collisions = [e for e in trajectory.events if e[0] == "collision"] if trajectory is not None else []
+        # A failed run is not worth keeping, one ended by a collision is complete
+        if trajectory is not None and (trajectory.available == len(self.t) or collisions):
+            self.cache.put(self.simulation_key, trajectory)
+
+        if collisions:
+            name, t, i, j = collisions[0]
+            msg = QMessageBox(self)
+            msg.setStyleSheet(msgbox_stylesheet)
+            msg.setText("Body {} and body {} collided at {:.1f} s".format(i + 1, j + 1, t))
+            msg.show()
 
+    def simulation_failed(self, message):
+        msg = QMessageBox(self)
+        msg.setStyleSheet(msgbox_stylesheet)
+        msg.setText("Integration failed: {}".format(message))
+        msg.show()
 
+    def closeEvent(self, event):
+        self.cancel_simulation()
+        super(MainWindow, self).closeEvent(event)
 
     # Function for getting the inputs from lineedits
     def get_inputs(self):
@@ -445,6 +553,9 @@ class MainWindow(QMainWindow):
 
             self.radius_cog = float(self.tb_radius_cog.text()) * 100
 
+            self.integrator = self.integrator_combobox.currentText()
+            self.collision_distance = float(self.tb_collision_distance.text())
+
             self.t = np.arange(float(self.time0.text()), float(self.timef.text()), float(self.timedt.text()))
 
             self.xmax = len(self.t)
@@ -466,21 +577,44 @@ class MainWindow(QMainWindow):
     def initMenu(self):
         self.menubar = QMenuBar()
 
+        self.file_menu = QMenu("&File", self.menubar)
         self.edit_menu = QMenu("&Edit", self.menubar)
         self.view_menu = QMenu("&View", self.menubar)
         self.about_menu = QAction("&About", self.menubar)
 
+        self.menubar.addMenu(self.file_menu)
         self.menubar.addMenu(self.edit_menu)
         self.menubar.addMenu(self.view_menu)
         self.menubar.addAction(self.about_menu)
 
         self.about_menu.triggered.connect(self.show_about)
 
+        self.open_run_action = QAction("Open Run...", self)
+        self.open_run_action.setShortcut(QKeySequence.StandardKey.Open)
+        self.open_run_action.triggered.connect(self.open_run)
+        self.file_menu.addAction(self.open_run_action)
+
+        self.save_run_action = QAction("Save Run...", self)
+        self.save_run_action.setShortcut(QKeySequence.StandardKey.Save)
+        self.save_run_action.triggered.connect(self.save_run)
+        self.file_menu.addAction(self.save_run_action)
+
+        self.save_trace_action = QAction("Save Timing Trace...", self)
+        self.save_trace_action.setToolTip("Write the phases recorded with View > Profiling for chrome://tracing or Perfetto")
+        self.save_trace_action.triggered.connect(self.save_trace)
+        self.file_menu.addAction(self.save_trace_action)
+
         self.prefs = QAction("Preferences", self)
         self.edit_menu.addAction(self.prefs)
 
         self.prefs.triggered.connect(self.show_prefs_dialog)
 
+        self.disk_cache_action = QAction("Keep runs on disk", self, checkable = True)
+        self.disk_cache_action.setChecked(self.disk_cache)
+        self.disk_cache_action.setToolTip("Store finished runs in {} so they load instantly next time".format(CACHE_DIR))
+        self.disk_cache_action.triggered.connect(self.toggle_disk_cache)
+        self.edit_menu.addAction(self.disk_cache_action)
+
         self.view_sidebar = QAction("Sidebar", self, checkable = True)
         self.view_sidebar.setChecked(True)
 
@@ -507,6 +641,25 @@ class MainWindow(QMainWindow):
 
         self.view_menu.addMenu(self.view_plot_menu)
 
+        self.view_blit_action = QAction("Fast redraw (blitting)", self, checkable = True)
+        self.view_blit_action.setChecked(self.blit_enabled)
+        self.view_blit_action.triggered.connect(self.toggle_blit)
+
+        self.view_menu.addAction(self.view_blit_action)
+
+        self.view_fading_trail_action = QAction("Fading trail", self, checkable = True)
+        self.view_fading_trail_action.setChecked(self.fading_trail)
+        self.view_fading_trail_action.setToolTip("Only show the most recent part of the trace, fading out")
+        self.view_fading_trail_action.triggered.connect(self.toggle_fading_trail)
+
+        self.view_menu.addAction(self.view_fading_trail_action)
+
+        self.view_profiling_action = QAction("Profiling", self, checkable = True)
+        self.view_profiling_action.setToolTip("Show the frame rate and the time spent in every phase of a frame and of the integration")
+        self.view_profiling_action.triggered.connect(self.toggle_profiling)
+
+        self.view_menu.addAction(self.view_profiling_action)
+
         self.setMenuBar(self.menubar)
 
     def view_energy_func(self):
@@ -514,6 +667,7 @@ class MainWindow(QMainWindow):
         if self.energy_plot_shown:
             for i in self.energyPlotAxesList:
                 i.set_visible(True)
+            self.update_artists()
         
             self.ax.set_position([-0.12,0.25,0.8,0.8])
             self.ax2.set_position([-0.01, 0.02, 0.3, 0.3])
@@ -526,6 +680,109 @@ class MainWindow(QMainWindow):
 
         self.canvas.draw()
 
+    def toggle_blit(self):
+        self.blit_enabled = self.view_blit_action.isChecked()
+        self.blitManager.set_enabled(self.blit_enabled)
+        self.canvas.draw()
+
+    # Inputs stored with a saved run and restored when it is opened
+    def run_fields(self):
+        names = ["tb_m1", "tb_m2", "tb_m3", "time0", "timef", "timedt",
+                 "tb_radius1", "tb_radius2", "tb_radius3", "tb_radius_cog", "tb_collision_distance"]
+        names += ["tb_{}{}{}".format(q, i, c) for q in "rv" for i in "123" for c in "xyz"]
+        return {name: getattr(self, name) for name in names}
+
+    def run_parameters(self):
+        params = {name: field.text() for name, field in self.run_fields().items()}
+        params.update(three_body_mode = self.three_body_mode, integrator = self.integrator_combobox.currentText(),
+                      colors = [self.tb_col1, self.tb_col2, self.tb_col3, self.tb_cog_col])
+        return params
+
+    def restore_run_parameters(self, params):
+        if params.get("three_body_mode", False) != self.three_body_mode:
+            self.three_body_toggle_checkbox.click()
+        self.pause_animation(False)
+
+        for name, field in self.run_fields().items():
+            if name in params:
+                field.setText(params[name])
+        if "integrator" in params:
+            self.integrator_combobox.setCurrentText(params["integrator"])
+        if "colors" in params:
+            self.tb_col1, self.tb_col2, self.tb_col3, self.tb_cog_col = params["colors"]
+            for preview, color in zip([self.tb_col1_preview, self.tb_col2_preview, self.tb_col3_preview, self.tb_cog_col_preview], params["colors"]):
+                preview.setStyleSheet("background: {}".format(color))
+
+    def save_run(self):
+        if getattr(self, "sim", None) is None or self.computing:
+            msg = QMessageBox(self)
+            msg.setStyleSheet(msgbox_stylesheet)
+            msg.setText("Wait for the integration to finish before saving")
+            msg.show()
+            return
+
+        path, _ = QFileDialog.getSaveFileName(self, "Save Run", "run.npz", "Runs (*.npz)")
+        if not path:
+            return
+        if not path.endswith(".npz"):
+            path += ".npz"
+        runfile.save(path, self.sim, self.run_params)
+
+    def open_run(self):
+        path, _ = QFileDialog.getOpenFileName(self, "Open Run", "", "Runs (*.npz)")
+        if not path:
+            return
+        try:
+            trajectory, params = runfile.load(path)
+        except (OSError, KeyError, ValueError) as e:
+            msg = QMessageBox(self)
+            msg.setStyleSheet(msgbox_stylesheet)
+            msg.setText("Could not open {}: {}".format(path, e))
+            msg.show()
+            return
+
+        self.cancel_simulation()
+        self.timer.stop()
+        self.timer_three_body.stop()
+
+        self.restore_run_parameters(params)
+        self.get_inputs()
+        # Nothing is integrated, the samples are read from the file as they are played
+        self.t = trajectory.t
+        self.run_params = params
+        self.anim_start_stop_button.setText("Reset Animation")
+        self.start_playback(trajectory)
+        self.clock.set_available(self.available)
+
+    def toggle_profiling(self):
+        enabled = self.view_profiling_action.isChecked()
+        self.profiler.set_enabled(enabled)
+        self.profileValue.setVisible(enabled)
+        self.profileValue.setText(self.profiler.summary() if enabled else "")
+
+    def save_trace(self):
+        if not self.profiler.events:
+            msg = QMessageBox(self)
+            msg.setStyleSheet(msgbox_stylesheet)
+            msg.setText("Nothing recorded yet, turn on View > Profiling first")
+            msg.show()
+            return
+
+        path, _ = QFileDialog.getSaveFileName(self, "Save Timing Trace", "trace.json", "Traces (*.json)")
+        if not path:
+            return
+        try:
+            self.profiler.dump(path)
+        except OSError as e:
+            msg = QMessageBox(self)
+            msg.setStyleSheet(msgbox_stylesheet)
+            msg.setText("Could not save {}: {}".format(path, e))
+            msg.show()
+
+    def toggle_disk_cache(self):
+        self.disk_cache = self.disk_cache_action.isChecked()
+        self.cache.directory = CACHE_DIR if self.disk_cache else None
+
     def show_prefs_dialog(self):
         prefs = PreferencesDialog(self)
         prefs.show()
@@ -755,6 +1012,22 @@ class MainWindow(QMainWindow):
         self.param_groupbox_layout.addWidget(QLabel("Radius COG"), 20, 0)
         self.param_groupbox_layout.addWidget(self.tb_radius_cog, 20, 1)
 
+        self.param_groupbox_layout.addWidget(Line(), 21, 0, 1, 2)
+
+        self.integrator_combobox = QComboBox()
+        self.integrator_combobox.addItems(METHODS)
+
+        # auto solves two bodies in closed form and integrates three with odeint.
+        # Collisions and periapsis passes are only detected by the adaptive methods
+        self.tb_collision_distance = QLineEdit("0")
+        self.tb_collision_distance.setToolTip("Bodies closer than this (km) stop the run, 0 disables it.\nOnly available with RK45, DOP853 and LSODA.")
+
+        self.param_groupbox_layout.addWidget(QLabel("Integrator"), 22, 0)
+        self.param_groupbox_layout.addWidget(self.integrator_combobox, 22, 1)
+
+        self.param_groupbox_layout.addWidget(QLabel("Collision distance"), 23, 0)
+        self.param_groupbox_layout.addWidget(self.tb_collision_distance, 23, 1)
+
         # Buttons
 
         self.anim_layout = QHBoxLayout()
@@ -816,6 +1089,15 @@ class MainWindow(QMainWindow):
         self.anim_speed_layout.addWidget(self.anim_speed_slider_label)
         self.anim_speed_layout.addWidget(self.anim_speed_slider)
         self.anim_speed_layout.addWidget(self.anim_speed_slider_value_label)
+
+        self.fps_label = QLabel("Target FPS: ")
+        self.fps_spinbox = QSpinBox()
+        self.fps_spinbox.setRange(1, 240)
+        self.fps_spinbox.setValue(self.target_fps)
+        self.fps_spinbox.valueChanged.connect(self.fps_func)
+
+        self.anim_speed_layout.addWidget(self.fps_label)
+        self.anim_speed_layout.addWidget(self.fps_spinbox)
         self.anim_groupbox_layout.addWidget(self.cog_box)
         self.anim_groupbox_layout.addWidget(self.trace_box)
         self.anim_groupbox_layout.addWidget(self.origin_box)
@@ -848,6 +1130,11 @@ class MainWindow(QMainWindow):
         self.timeLayout.addWidget(self.timeValue)
         self.timeLayout.addWidget(self.timeProgressbar)
 
+        # Frame and integration timings, see View > Profiling
+        self.profileValue = QLabel("")
+        self.profileValue.setVisible(False)
+        self.timeLayout.addWidget(self.profileValue)
+
         self.rightLayout.addWidget(self.param_groupbox)
         self.rightLayout.addWidget(self.anim_groupbox)
 
@@ -897,6 +1184,7 @@ class MainWindow(QMainWindow):
             self.tb_v3_layout.itemAt(i).widget().setHidden(not self.three_body_mode)
 
         self.pause_animation(True)
+        self.cancel_simulation()
 
         if self.three_body_mode:
             self.timer.stop()
@@ -914,6 +1202,12 @@ class MainWindow(QMainWindow):
         D = self.anim_speed_slider.value()
         self.anim_speed_slider_value_label.setText(str(D))
         self.anim_speed = D
+        self.clock.set_speed(D * 100)
+
+    def fps_func(self):
+        self.target_fps = self.fps_spinbox.value()
+        self.clock.set_fps(self.target_fps)
+        self.update_timer_interval()
 
     def set_plot_face_color(self):
         #plt.style.use("fivethirtyeight")
@@ -935,115 +1229,84 @@ class MainWindow(QMainWindow):
         #self.tb_col1_preview.setText(cd.name())
         self.tb_cog_col = cd.name()
         self.tb_cog_col_preview.setStyleSheet("background: {}".format(cd.name()))
+        self.apply_colors()
 
     def get_col1(self):
         cd = QColorDialog().getColor()
         #self.tb_col1_preview.setText(cd.name())
         self.tb_col1 = cd.name()
         self.tb_col1_preview.setStyleSheet("background: {}".format(cd.name()))
+        self.apply_colors()
 
     def get_col2(self):
         cd = QColorDialog().getColor()
         #self.tb_col1_preview.setText(cd.name())
         self.tb_col2 = cd.name()
         self.tb_col2_preview.setStyleSheet("background: {}".format(cd.name()))
+        self.apply_colors()
 
     def get_col3(self):
         cd = QColorDialog().getColor()
         #self.tb_col1_preview.setText(cd.name())
         self.tb_col3 = cd.name()
         self.tb_col3_preview.setStyleSheet("background: {}".format(cd.name()))
+        self.apply_colors()
 
     def init_vals(self):
         self.get_inputs()
-        self.G = 6.6743e-20 # km^3 kg^(-1)s^(-2)
-
-    # Model function
-    def TwoBodyProblem(self, y, t, G, m1, m2):
-        r1 = y[: 3]
-        r2 = y[3 : 6]
-
-        v1 = y[6 : 9]
-        v2 = y[9 : 12]
+        self.G = G
 
-        r = np.linalg.norm(r2 - r1)
-
-        c0 = y[6 : 12]
-        c1 = G * m2 * ((r2 - r1)/np.power(r, 3))
-        c2 = G * m1 * ((r1 - r2)/np.power(r, 3))
-
-        return np.concatenate((c0, c1, c2))
-
-    def ThreeBodyProblem(self, y, t, G, m1, m2, m3):
-        r1 = y[: 3]
-        r2 = y[3 : 6]
-        r3 = y[6 : 9]
-
-        v1 = y[9: 12]
-        v2 = y[12 : 15]
-        v3 = y[15: 18]
+    def simulation_inputs(self):
+        if self.three_body_mode:
+            return [self.m1, self.m2, self.m3], [self.r1, self.r2, self.r3], [self.v1, self.v2, self.v3]
+        return [self.m1, self.m2], [self.r1, self.r2], [self.v1, self.v2]
 
-        r12 = np.linalg.norm(r2 - r1)
-        r13 = np.linalg.norm(r1 - r3)
-        r23 = np.linalg.norm(r2 - r3)
+    def simulation_options(self):
+        return dict(method=self.integrator, events=("collision", "periapsis"), collision_distance=self.collision_distance)
 
-        c0 = y[9 : 18]
-        c1 = G * (m2 * ((r2 - r1)/np.power(r12, 3)) + m3 * ((r3 - r1)/np.power(r13, 3)))
-        c2 = G * (m1 * ((r1 - r2)/np.power(r12, 3)) + m3 * ((r3 - r2)/np.power(r23, 3)))
-        c3 = G * (m1 * ((r1 - r3)/np.power(r13, 3)) + m2 * ((r2 - r3)/np.power(r23, 3)))
+    def scratch_directory(self):
+        bodies = len(self.simulation_inputs()[0])
+        if len(self.t) * 6 * bodies * 8 <= MEMORY_LIMIT:
+            return None
+        # Removed with the object, once the next large run replaces it. Mapped
+        # files stay readable after that as long as the run is still in use.
+        self.scratch = tempfile.TemporaryDirectory(prefix = "two-body-problem-", ignore_cleanup_errors = True)
+        return self.scratch.name
 
-        return np.concatenate((c0, c1, c2, c3))
+    def simulation_cache_key(self):
+        return run_key(*self.simulation_inputs(), self.t, self.G, **self.simulation_options())
 
     def calc(self):
+        with self.profiler.phase("cache lookup", "simulation"):
+            key = self.simulation_cache_key()
+            sim = self.cache.get(key)
+        if sim is None:
+            with self.profiler.phase("integration", "simulation"):
+                sim = simulate(*self.simulation_inputs(), self.t, G=self.G, **self.simulation_options())
+            with self.profiler.phase("cache store", "simulation"):
+                self.cache.put(key, sim)
+        self.run_params = self.run_parameters()
+        with self.profiler.phase("set trajectory", "simulation"):
+            self.set_trajectory(sim)
+
+    def set_trajectory(self, sim):
+        self.sim = sim
         self.T = len(self.t)
+        self.available = sim.available
         self.timeProgressbar.setMaximum(len(self.t))
 
         if not self.three_body_mode:
-            y0 = np.concatenate((self.r1, self.r2, self.v1, self.v2))
-            y = odeint(self.TwoBodyProblem, y0, self.t, args=(self.G, self.m1, self.m2))
-
-            self.r1_sol = y[:, :3]
-            self.r2_sol = y[:, 3: 6]
-            
-            self.v1_sol = y[:, 6: 9]
-            self.v2_sol = y[:, 9: 12]
-
-            self.v1_res = [round(np.linalg.norm(i), 6) for i in self.v1_sol]
-            self.v2_res = [round(np.linalg.norm(i), 6) for i in self.v2_sol]
-
-            self.KE1 = 0.5 * self.m1 * np.array([np.power(i, 2) for i in self.v1_res])
-            self.KE2 = 0.5 * self.m1 * np.array([np.power(i, 2) for i in self.v2_res])
-
-            self.totalE = [x + y for x, y in zip(self.KE1, self.KE2)] 
-
-            self.ymin1, self.ymax1 = min(self.KE1), max(self.KE1)
-            self.ymin2, self.ymax2 = min(self.KE2), max(self.KE2)
-            self.ymin3, self.ymax3 = min(self.totalE), max(self.totalE)
-            
-            # Center of mass
-            self.cog_sol = (self.m1 * self.r1_sol + self.m2 * self.r2_sol)/(self.m1 + self.m2)
-
-            self.t1_sol = self.r1_sol - self.cog_sol
-            self.t2_sol = self.r2_sol - self.cog_sol
-
-            self.cog_sol_t = (self.m1 * self.t1_sol + self.m2 * self.t2_sol)/(self.m1 + self.m2)
+            self.r1_sol, self.r2_sol = sim.r_sol[:, 0], sim.r_sol[:, 1]
+            self.v1_sol, self.v2_sol = sim.v_sol[:, 0], sim.v_sol[:, 1]
+            self.t1_sol, self.t2_sol = sim.t_sol[:, 0], sim.t_sol[:, 1]
         else:
-            self.get_inputs()
-            y0 = np.concatenate((self.r1, self.r2, self.r3, self.v1, self.v2, self.v3))
-            y = odeint(self.ThreeBodyProblem, y0, self.t, args=(self.G, self.m1, self.m2, self.m3))
-
-            self.r1_sol = y[:, :3]
-            self.r2_sol = y[:, 3: 6]
-            self.r3_sol = y[:, 6: 9]
-
-            # Center of mass
-            self.cog_sol = (self.m1 * self.r1_sol + self.m2 * self.r2_sol + self.m3 * self.r3_sol)/(self.m1 + self.m2 + self.m3)
+            self.r1_sol, self.r2_sol, self.r3_sol = sim.r_sol[:, 0], sim.r_sol[:, 1], sim.r_sol[:, 2]
+            self.t1_sol, self.t2_sol, self.t3_sol = sim.t_sol[:, 0], sim.t_sol[:, 1], sim.t_sol[:, 2]
 
-            self.t1_sol = self.r1_sol - self.cog_sol
-            self.t2_sol = self.r2_sol - self.cog_sol
-            self.t3_sol = self.r3_sol - self.cog_sol
+        self.KE1, self.KE2, self.totalE = sim.KE[:, 0], sim.KE[:, 1], sim.totalE
 
-            self.cog_sol_t = (self.m1 * self.t1_sol + self.m2 * self.t2_sol + self.m3 * self.t3_sol)/(self.m1 + self.m2 + self.m3)
+        self.cog_sol = sim.cog_sol
+        self.cog_sol_t = sim.cog_sol_t
 
 if __name__ == "__main__":
     qapp = QApplication(sys.argv)
@@ -0,0 +1,104 @@
+"""Per-phase timings of animation frames and simulation runs.
+
+Code to be measured is wrapped in phases,
+
+    with profiler.phase('orbits'):
+        view.update(num)
+
+and every animation frame ends with frame_done(). While the profiler is
+enabled it keeps a smoothed average of every frame phase, the frame rate,
+the duration of the latest phase of category 'simulation' of every name,
+and a trace of all individual phases that dump() writes in the Trace Event
+format of chrome://tracing and https://ui.perfetto.dev. Disabled, a phase
+costs about as much as an empty with statement.
+"""
+import collections
+import contextlib
+import json
+import threading
+import time
+
+# Phases kept for the trace, the oldest are dropped first
+HISTORY = 100000
+
+
+class Profiler:
+    def __init__(self, clock=time.perf_counter):
+        self.clock = clock
+        self.enabled = False
+        self.origin = clock()
+        self.events = collections.deque(maxlen=HISTORY)
+        # Seconds of the latest 'simulation' phase of every name
+        self.latest = {}
+        self.set_enabled(False)
+
+    def set_enabled(self, enabled):
+        self.enabled = enabled
+        # Smoothed seconds per frame of every frame phase, in first seen order
+        self.averages = {}
+        self.frame_seconds = 0.0
+        self.last_frame = None
+        self.pending = {}
+
+    @contextlib.contextmanager
+    def phase(self, name, category='frame'):
+        # Simulation phases are rare, their latest duration is always kept
+        if not self.enabled and category == 'frame':
+            yield
+            return
+        start = self.clock()
+        try:
+            yield
+        finally:
+            self.add(name, start, self.clock(), category)
+
+    def add(self, name, start, stop, category='frame'):
+        """Record a phase measured elsewhere, e.g. in a worker thread."""
+        if category == 'simulation':
+            self.latest[name] = stop - start
+        if not self.enabled:
+            return
+        self.events.append((name, category, start, stop, threading.get_ident()))
+        if category == 'frame':
+            self.pending[name] = self.pending.get(name, 0.0) + stop - start
+
+    def frame_done(self):
+        if not self.enabled:
+            return
+        now = self.clock()
+        if self.last_frame is not None:
+            self.frame_seconds = smooth(self.frame_seconds, now - self.last_frame)
+        self.last_frame = now
+
+        for name in list(self.averages) + [i for i in self.pending if i not in self.averages]:
+            self.averages[name] = smooth(self.averages.get(name, 0.0), self.pending.get(name, 0.0))
+        self.pending = {}
+
+    def fps(self):
+        return 1 / self.frame_seconds if self.frame_seconds > 0 else 0.0
+
+    def summary(self):
+        """One line of frame rate, frame phases in ms and the other phases."""
+        frame = sum(self.averages.values())
+        phases = ", ".join("{} {:.1f}".format(name, 1000 * seconds) for name, seconds in self.averages.items())
+        text = "{:.0f} fps | frame {:.1f} ms ({})".format(self.fps(), 1000 * frame, phases)
+        for name, seconds in self.latest.items():
+            text += " | {} {}".format(name, duration(seconds))
+        return text
+
+    def dump(self, path):
+        """Write the recorded phases as a Trace Event JSON file."""
+        events = [dict(name=name, cat=category, ph="X", pid=0, tid=thread,
+                       ts=1e6 * (start - self.origin), dur=1e6 * (stop - start))
+                  for name, category, start, stop, thread in list(self.events)]
+        with open(path, "w") as f:
+            json.dump(dict(traceEvents=events, displayTimeUnit="ms"), f)
+
+
+def duration(seconds):
+    return "{:.2f} s".format(seconds) if seconds >= 1 else "{:.1f} ms".format(1000 * seconds)
+
+
+def smooth(average, value):
+    # Same weights as the draw time of PlaybackClock
+    return 0.8 * average + 0.2 * value
@@ -0,0 +1,439 @@
+"""Persistent matplotlib artists for the orbit and energy plots.
+
+The artists are created once per simulation run and every animation frame
+only moves their data, instead of clearing the axes and re-plotting. With
+BlitManager the moving artists are additionally drawn on top of a cached
+background, so a frame does not re-render panes, ticks or titles.
+
+Trails are drawn from a decimated copy of the trajectory with a vertex
+budget that follows the size of the axes in pixels, so a frame late in a
+long run costs about as much as an early one.
+"""
+import numpy as np
+from matplotlib.colors import to_rgba
+from matplotlib.ticker import AutoLocator, NullLocator, ScalarFormatter, NullFormatter
+from mpl_toolkits.mplot3d.art3d import Line3DCollection
+
+# Samples read at once when scanning a whole run, which may live on disk
+BLOCK = 1 << 18
+
+
+def bounds(array, start, stop):
+    """Minimum and maximum over samples [start, stop), block by block."""
+    # Quantities that know their bounds, see simulation.core.Derived
+    known = array.bounds(start, stop) if hasattr(array, 'bounds') else None
+    if known is not None:
+        return known
+
+    lows, highs = [], []
+    for i in range(start, stop, BLOCK):
+        block = np.asarray(array[i : min(i + BLOCK, stop)])
+        lows.append(block.min(axis=0))
+        highs.append(block.max(axis=0))
+    return np.min(lows, axis=0), np.max(highs, axis=0)
+
+
+class DecimatedTrail:
+    """Multi-resolution copy of one trajectory for drawing trail prefixes.
+
+    Level k splits the samples into buckets of 2**k and keeps two points of
+    each, its first sample and the sample farthest from the chord through
+    the bucket, so sharp turns such as periapsis passes survive. A prefix
+    of `stop` samples is drawn from the coarsest level that still has
+    enough points for the budget, and the samples after its last full
+    bucket from at most one bucket of each finer level, like the binary
+    digits of `stop`, so it never takes more than budget + 2 * k + 1
+    points. Levels are built on first use, block by block, and extended as
+    playback reaches new buckets, so streamed and lazily derived
+    trajectories work as well.
+    """
+
+    def __init__(self, r):
+        self.r = r
+        # level -> (points buffer, number of buckets in it)
+        self.levels = {}
+        # level -> (bucket, its two points), the latest partial bucket of every finer level
+        self.partial = {}
+
+    def prefix(self, stop, budget):
+        """Points tracing samples [0, stop), about `budget` of them at most."""
+        if stop <= budget:
+            return np.asarray(self.r[:stop])
+
+        k = int(np.ceil(np.log2(2 * stop / budget)))
+        buckets = stop >> k
+        parts = [self.level(k, buckets)]
+        done = buckets << k
+        for j in range(k - 1, 0, -1):
+            if stop - done >= 1 << j:
+                parts.append(self.bucket(j, done >> j))
+                done += 1 << j
+        # Always end at the last sample, the current position of the body
+        parts.append(np.asarray(self.r[min(done, stop - 1) : stop]))
+        return np.concatenate(parts)
+
+    def level(self, k, buckets):
+        size = 1 << k
+        points, done = self.levels.get(k, (np.empty((0, 3)), 0))
+
+        if buckets > done:
+            # Grow the buffer geometrically so extending it is amortized O(1)
+            needed = 2 * buckets
+            if len(points) < needed:
+                grown = np.empty((max(needed, 2 * len(points)), 3))
+                grown[: 2 * done] = points[: 2 * done]
+                points = grown
+
+            step = max(BLOCK // size, 1)
+            for first in range(done, buckets, step):
+                last = min(first + step, buckets)
+                block = np.asarray(self.r[first * size : last * size]).reshape(-1, size, 3)
+                points[2 * first : 2 * last : 2], points[2 * first + 1 : 2 * last : 2] = reduce_buckets(block)
+            self.levels[k] = (points, buckets)
+
+        return points[: 2 * buckets]
+
+    def bucket(self, j, index):
+        """The two points of bucket `index` of level j, without building the level."""
+        if j in self.levels and self.levels[j][1] > index:
+            return self.levels[j][0][2 * index : 2 * index + 2]
+        cached = self.partial.get(j)
+        if cached is None or cached[0] != index:
+            size = 1 << j
+            block = np.asarray(self.r[index * size : (index + 1) * size]).reshape(1, size, 3)
+            cached = index, np.concatenate(reduce_buckets(block))
+            self.partial[j] = cached
+        return cached[1]
+
+
+def reduce_buckets(block):
+    """First sample and sample farthest from the chord of every bucket of a
+    (buckets, size, 3) block."""
+    rel = block - block[:, :1]
+    chord = rel[:, -1:]
+    # Squared distance from the chord, or from the start if the bucket ends where it began
+    cross = np.cross(rel, chord)
+    length = np.einsum('ijk,ijk->ij', chord, chord)
+    distance = np.where(length > 0, np.einsum('ijk,ijk->ij', cross, cross) / np.maximum(length, 1e-300),
+                        np.einsum('ijk,ijk->ij', rel, rel))
+    return block[:, 0], block[np.arange(len(block)), distance.argmax(axis=1)]
+
+
+class OrbitView:
+    """Body markers, trails, origin points and COG marker of one 3D axes."""
+
+    def __init__(self, ax):
+        self.ax = ax
+        self.trajectories = []
+        self.cog_traj = None
+        self.bodies = []
+        self.trails = []
+        self.tails = []
+        self.decimated = []
+        self.colors = []
+        self.origins = []
+        self.cog = None
+        self.animated = False
+        self.trace_shown = True
+        # 'full' draws the whole history, 'fade' the last tail_length samples fading out
+        self.trail_mode = 'full'
+        self.tail_length = 500
+
+    def artists(self):
+        extra = [self.cog] if self.cog is not None else []
+        return self.trails + self.tails + self.bodies + self.origins + extra
+
+    def clear(self):
+        for artist in self.artists():
+            artist.remove()
+        self.trajectories = []
+        self.cog_traj = None
+        self.bodies = []
+        self.trails = []
+        self.tails = []
+        self.decimated = []
+        self.colors = []
+        self.origins = []
+        self.cog = None
+
+    def setup(self, trajectories, colors, sizes, cog=None, cog_color=None, cog_size=None, origins=False, count=None):
+        self.clear()
+        self.trajectories = trajectories
+        self.cog_traj = cog
+
+        for r, c, s in zip(trajectories, colors, sizes):
+            trail, = self.ax.plot3D(r[:1, 0], r[:1, 1], r[:1, 2], c=c)
+            self.trails.append(trail)
+            tail = Line3DCollection([], linewidths=trail.get_linewidth())
+            self.ax.add_collection(tail)
+            self.tails.append(tail)
+            self.decimated.append(DecimatedTrail(r))
+            self.colors.append(c)
+            self.bodies.append(self.ax.scatter(r[0, 0], r[0, 1], r[0, 2], c=c, marker='o', s=s))
+
+        if origins:
+            for r in trajectories:
+                self.origins.append(self.ax.scatter(r[0, 0], r[0, 1], r[0, 2], c='black', marker='o', s=50))
+
+        if cog is not None:
+            self.cog = self.ax.scatter(cog[0, 0], cog[0, 1], cog[0, 2], c=cog_color, marker='o', s=cog_size)
+
+        # The axes are never cleared any more, so fix the limits to the whole
+        # run once instead of letting them follow the growing trace.
+        self.autoscale(0, count if count is not None else len(trajectories[0]), had_data=False)
+
+        self.set_animated(self.animated)
+        self.apply_trail_visibility()
+
+    # Grow the limits to cover samples [start, stop), e.g. a newly computed
+    # chunk. Returns whether the limits changed.
+    def autoscale(self, start, stop, had_data=True):
+        if stop <= start:
+            return False
+        arrays = list(self.trajectories) + ([self.cog_traj] if self.cog_traj is not None else [])
+        points = np.array([corner for i in arrays for corner in bounds(i, start, stop)])
+        before = self.ax.get_w_lims()
+        self.ax.auto_scale_xyz(points[:, 0], points[:, 1], points[:, 2], had_data=had_data)
+        return self.ax.get_w_lims() != before
+
+    # Artists that move between frames, the origin points are static
+    def animated_artists(self):
+        extra = [self.cog] if self.cog is not None else []
+        return self.trails + self.tails + self.bodies + extra
+
+    def set_animated(self, animated):
+        self.animated = animated
+        for artist in self.animated_artists():
+            artist.set_animated(animated)
+
+    def set_colors(self, colors, cog_color):
+        # The tails are recolored with their fade on the next update
+        self.colors = list(colors[: len(self.trails)])
+        for trail, body, c in zip(self.trails, self.bodies, colors):
+            trail.set_color(c)
+            body.set_color(c)
+        if self.cog is not None:
+            self.cog.set_color(cog_color)
+
+    def set_visibility(self, trace_shown, cog_shown, origin_shown):
+        self.trace_shown = trace_shown
+        self.apply_trail_visibility()
+        for origin in self.origins:
+            origin.set_visible(origin_shown)
+        if self.cog is not None:
+            self.cog.set_visible(cog_shown)
+
+    def set_trail_mode(self, mode, tail_length=None):
+        self.trail_mode = mode
+        if tail_length is not None:
+            self.tail_length = tail_length
+        self.apply_trail_visibility()
+
+    def apply_trail_visibility(self):
+        for trail in self.trails:
+            trail.set_visible(self.trace_shown and self.trail_mode == 'full')
+        for tail in self.tails:
+            tail.set_visible(self.trace_shown and self.trail_mode == 'fade')
+
+    # About two vertices per pixel along the longer side of the axes
+    def vertex_budget(self):
+        return max(int(2 * max(self.ax.bbox.width, self.ax.bbox.height)), 64)
+
+    def set_style(self, axes_shown, ticks_shown, grid_shown, labels_shown):
+        if axes_shown:
+            self.ax.set_axis_on()
+        else:
+            self.ax.set_axis_off()
+        self.ax.grid(grid_shown)
+
+        for axis in (self.ax.xaxis, self.ax.yaxis, self.ax.zaxis):
+            axis.set_major_locator(AutoLocator() if ticks_shown else NullLocator())
+            axis.set_major_formatter(ScalarFormatter() if labels_shown else NullFormatter())
+
+    def update(self, num):
+        budget = self.vertex_budget()
+        for i, (r, body) in enumerate(zip(self.trajectories, self.bodies)):
+            if self.trails[i].get_visible():
+                trace = self.decimated[i].prefix(num + 1, budget)
+                self.trails[i].set_data_3d(trace[:, 0], trace[:, 1], trace[:, 2])
+            elif self.tails[i].get_visible():
+                self.update_tail(i, num, budget)
+            current = r[num : num + 1]
+            body._offsets3d = (current[:, 0], current[:, 1], current[:, 2])
+
+        if self.cog is not None:
+            c = self.cog_traj[num : num + 1]
+            self.cog._offsets3d = (c[:, 0], c[:, 1], c[:, 2])
+
+    def update_tail(self, i, num, budget):
+        start = max(num + 1 - self.tail_length, 0)
+        # A long tail is thinned to the budget by taking every n-th sample,
+        # always ending on the current one
+        stride = max(-(-(num + 1 - start) // budget), 1)
+        points = np.asarray(self.trajectories[i][start : num + 1])[::-1][::stride][::-1]
+
+        segments = np.stack([points[:-1], points[1:]], axis=1)
+        colors = np.tile(to_rgba(self.colors[i]), (len(segments), 1))
+        colors[:, 3] = np.linspace(0, 1, len(segments) + 1)[1:]
+        self.tails[i].set_segments(segments)
+        self.tails[i].set_color(colors)
+
+
+class EnergyView:
+    """A single energy time series drawn on a 2D axes.
+
+    The x axis always spans the whole run, so one pixel column covers
+    `bucket` samples. The revealed part of the series is drawn from the
+    minimum and maximum of every bucket, in the order they occur, which
+    looks the same as the full series at this resolution but never has more
+    than about two vertices per pixel. Buckets are reduced once, as
+    playback or the integration reaches them, so a frame only touches the
+    newly revealed samples plus the partial bucket at the cursor.
+    """
+
+    def __init__(self, ax, fmt):
+        self.ax = ax
+        self.fmt = fmt
+        self.series = None
+        self.line = None
+        self.cursor = None
+        self.animated = False
+
+    def clear(self):
+        for artist in self.animated_artists():
+            artist.remove()
+        self.series = None
+        self.line = None
+        self.cursor = None
+
+    def setup(self, series, count=None):
+        self.clear()
+        self.series = series
+        self.length = len(series)
+        self.line, = self.ax.plot([], [], self.fmt, markersize=1)
+        self.cursor, = self.ax.plot([], [], 'o', color=self.line.get_color(), markersize=4)
+
+        self.bucket = max(-(-self.length // max(int(self.ax.bbox.width), 1)), 1)
+        buckets = self.length // self.bucket
+        # Per bucket its minimum and maximum, in time order
+        self.xs = np.empty(2 * buckets)
+        self.ys = np.empty(2 * buckets)
+        self.done = 0
+
+        self.ax.set_xlim(0, max(self.length, 1))
+        self.autoscale(count if count is not None else self.length)
+
+        self.set_animated(self.animated)
+
+    def extend(self, stop):
+        """Reduce the full buckets among samples [0, stop)."""
+        buckets = min(stop // self.bucket, len(self.xs) // 2)
+        size = self.bucket
+        for first in range(self.done, buckets, max(BLOCK // size, 1)):
+            last = min(first + max(BLOCK // size, 1), buckets)
+            block = np.asarray(self.series[first * size : last * size]).reshape(-1, size)
+            lo, hi = block.argmin(axis=1), block.argmax(axis=1)
+            before = lo <= hi
+            rows = np.arange(len(block))
+            offset = np.arange(first, last) * size
+
+            self.xs[2 * first : 2 * last : 2] = offset + np.where(before, lo, hi)
+            self.xs[2 * first + 1 : 2 * last : 2] = offset + np.where(before, hi, lo)
+            self.ys[2 * first : 2 * last : 2] = block[rows, np.where(before, lo, hi)]
+            self.ys[2 * first + 1 : 2 * last : 2] = block[rows, np.where(before, hi, lo)]
+        self.done = max(self.done, buckets)
+
+    # Fit the y limits to the first `stop` samples, returns whether they changed
+    def autoscale(self, stop):
+        if self.series is None or stop == 0:
+            return False
+        ymin, ymax = self.bounds(stop)
+        if ymin < ymax and (ymin, ymax) != self.ax.get_ylim():
+            self.ax.set_ylim(ymin, ymax)
+            return True
+        return False
+
+    def bounds(self, stop):
+        # Stored bounds, e.g. of a run file, need no samples at all
+        known = self.series.bounds(0, stop) if hasattr(self.series, 'bounds') else None
+        if known is not None:
+            return known
+
+        self.extend(stop)
+        reduced = min(self.done, stop // self.bucket)
+        values = [self.ys[: 2 * reduced], np.asarray(self.series[reduced * self.bucket : stop])]
+        values = np.concatenate(values)
+        return values.min(), values.max()
+
+    def animated_artists(self):
+        return [i for i in (self.line, self.cursor) if i is not None]
+
+    def set_animated(self, animated):
+        self.animated = animated
+        for artist in self.animated_artists():
+            artist.set_animated(animated)
+
+    def update(self, num):
+        if self.line is None:
+            return
+        self.extend(num + 1)
+        # The sample at the cursor always stays in the tail
+        reduced = min(self.done, num // self.bucket)
+        start = reduced * self.bucket
+        tail = np.asarray(self.series[start : num + 1])
+        # The partial bucket is less than a pixel wide as well
+        picks = np.unique([tail.argmin(), tail.argmax(), len(tail) - 1])
+
+        self.line.set_data(np.concatenate([self.xs[: 2 * reduced], start + picks]),
+                           np.concatenate([self.ys[: 2 * reduced], tail[picks]]))
+        self.cursor.set_data([num], tail[-1:])
+
+
+class BlitManager:
+    """Blit the animated artists of a set of views over cached backgrounds.
+
+    The background of every visible axes is grabbed after each full draw of
+    the canvas, so resizing, rotating a 3D view or changing the style (which
+    all trigger a full draw) invalidate the cache automatically.
+    """
+
+    def __init__(self, canvas, views):
+        self.canvas = canvas
+        self.views = views
+        self.enabled = False
+        self.backgrounds = {}
+        self.cid = canvas.mpl_connect('draw_event', self.on_draw)
+
+    def set_enabled(self, enabled):
+        self.enabled = enabled
+        self.backgrounds = {}
+        for view in self.views:
+            view.set_animated(enabled)
+
+    def on_draw(self, event):
+        if not self.enabled:
+            return
+        self.backgrounds = {view.ax: self.canvas.copy_from_bbox(view.ax.bbox)
+                            for view in self.views if view.ax.get_visible()}
+        self.draw_animated()
+
+    def draw_animated(self):
+        for view in self.views:
+            if view.ax not in self.backgrounds:
+                continue
+            for artist in view.animated_artists():
+                # 3D collections are only projected inside Axes3D.draw
+                if hasattr(artist, 'do_3d_projection'):
+                    artist.do_3d_projection()
+                view.ax.draw_artist(artist)
+
+    def update(self):
+        if not self.enabled or not self.backgrounds:
+            self.canvas.draw()
+            return
+
+        for background in self.backgrounds.values():
+            self.canvas.restore_region(background)
+        self.draw_animated()
+        for ax in self.backgrounds:
+            self.canvas.blit(ax.bbox)
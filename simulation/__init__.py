@@ -0,0 +1,10 @@
+"""Headless simulation core shared by the GUIs and batch scripts.
+
+Nothing in this package imports PyQt6 or matplotlib, so it can be used from
+worker processes without a display.
+"""
+from .core import G, FORCES, Cancelled, Trajectory, simulate, stream
+from .integrators import METHODS, EVENTS
+from .invariants import kinetic_energy, potential_energy, total_energy, linear_momentum, angular_momentum
+from .nbody import NBodyProblem, TiledProblem
+from .barneshut import BarnesHutProblem
@@ -0,0 +1,106 @@
+"""Run one simulation without the GUI.
+
+Takes the inputs of the GUI from flags or a JSON config file, flags win,
+and writes the trajectory as a run file together with its diagnostics:
+
+    python -m simulation --m2 1e21 --v2 0,45,0 --tf 4800 --out run.npz
+    python -m simulation --config run.json --three-body
+
+A config file holds the same names, e.g. {"m1": 1e26, "r2": [0, 3000, 0],
+"bodies": 3}. The run file opens in the GUI (File > Open Run) with these
+inputs filled in and is read by export.py; the diagnostics are a JSON
+object with the final state, energy error and closest approach, the
+columns of simulation.batch.
+"""
+import argparse
+import json
+import os
+import sys
+
+from . import runfile
+from .batch import DEFAULTS, VECTORS, diagnostics, format_value, parse_value, simulate_params
+
+# Display only, stored with the run for the GUI and export.py
+RADII = dict(radius1=2.0, radius2=2.0, radius3=2.0, radius_cog=1.0)
+
+
+def coerce(name, value):
+    """A parameter from a flag or a config file in the type of its default."""
+    if isinstance(value, str):
+        value = parse_value(name, value)
+    if name in VECTORS:
+        vector = tuple(float(x) for x in value)
+        if len(vector) != 3:
+            raise ValueError(f'{name} needs three components')
+        return vector
+    if name in ('bodies', 'threads'):
+        return int(value)
+    if name in ('method', 'force'):
+        return str(value)
+    return float(value)
+
+
+def gui_parameters(p):
+    """p as the inputs of the GUI, in the format of MainWindow.run_parameters."""
+    params = {'tb_m1': str(p['m1']), 'tb_m2': str(p['m2']), 'tb_m3': str(p['m3']),
+              'time0': str(p['t0']), 'timef': str(p['tf']), 'timedt': str(p['dt']),
+              'tb_collision_distance': str(p['collision_distance'])}
+    for name in ('radius1', 'radius2', 'radius3', 'radius_cog'):
+        params['tb_' + name] = str(p[name])
+    for name in VECTORS:
+        for c, value in zip('xyz', p[name]):
+            params[f'tb_{name}{c}'] = str(value)
+    params.update(three_body_mode=p['bodies'] == 3, integrator=p['method'])
+    return params
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog='python -m simulation',
+                                     description='Simulate one set of initial conditions and write the trajectory and its diagnostics.')
+    parser.add_argument('--config', help='JSON file of parameters, flags override it')
+    for name, default in dict(DEFAULTS, **RADII).items():
+        parser.add_argument(f'--{name.replace("_", "-")}', dest=name, metavar='VALUE',
+                            help=f'default {format_value(default)}')
+    parser.add_argument('--three-body', dest='bodies', action='store_const', const='3', help='same as --bodies 3')
+    parser.add_argument('--out', default='run.npz', help='run file to write, default run.npz')
+    parser.add_argument('--diagnostics', help='JSON diagnostics, defaults to the run file with .json')
+    parser.add_argument('--no-trajectory', action='store_true', help='only write the diagnostics')
+    args = parser.parse_args(argv)
+
+    p = dict(DEFAULTS, **RADII)
+    try:
+        if args.config is not None:
+            with open(args.config) as f:
+                config = json.load(f)
+            unknown = sorted(set(config) - set(p))
+            if unknown:
+                parser.error(f'{args.config}: unknown parameters {", ".join(unknown)}')
+            p.update({name: coerce(name, value) for name, value in config.items()})
+        p.update({name: coerce(name, getattr(args, name)) for name in p if getattr(args, name) is not None})
+    except OSError as e:
+        parser.error(f'cannot read config: {e}')
+    except (TypeError, ValueError) as e:
+        parser.error(f'invalid parameter: {e}')
+    if p['bodies'] not in (2, 3):
+        parser.error('bodies must be 2 or 3')
+
+    try:
+        sim, seconds = simulate_params(p)
+    except (RuntimeError, ValueError) as e:
+        print(f'Simulation failed: {e}', file=sys.stderr)
+        return 1
+
+    path = args.diagnostics or os.path.splitext(args.out)[0] + '.json'
+    summary = dict(parameters=p, **diagnostics(sim, seconds))
+    with open(path, 'w') as f:
+        json.dump(summary, f, indent=2)
+
+    if not args.no_trajectory:
+        runfile.save(args.out, sim, gui_parameters(p))
+        print(f'Wrote {sim.available} samples to {args.out}')
+    print(f'Wrote diagnostics to {path}')
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,159 @@
+"""Barnes-Hut tree code for the accelerations of many bodies.
+
+Direct summation costs O(N^2) per evaluation and its (N, N, 3) temporaries
+outgrow the memory at some ten thousand bodies. The tree code groups
+distant bodies into the cells of an octree and lets each cell act through
+its total mass at its center of mass, which costs O(N log N).
+
+The octree is rebuilt for every evaluation, entirely with array operations:
+the bodies are sorted by the Morton key of their position in the bounding
+cube, so the cells of every level are contiguous runs of the sorted keys
+and their masses and centers of mass are segment sums. The tree is then
+walked one level at a time for all (body, cell) pairs at once. A cell is
+accepted when it does not contain the body and is far enough to look
+smaller than theta, d > s / theta + delta for its side s, its distance d
+from the body and the distance delta of its center of mass from its
+middle, which guards against lopsided cells. Otherwise it is replaced by
+its children, or when it holds at most BUCKET bodies, by these bodies,
+which act exactly. theta = 0 reproduces direct summation up to rounding.
+"""
+import numpy as np
+
+# Bits of the Morton key per axis, three of them fit in an int64
+DEPTH = 21
+
+# Cells of at most this many bodies are not opened, their bodies act directly
+BUCKET = 8
+
+
+class BarnesHutProblem:
+    """Callable derivative dy/dt = f(y, t) with tree code accelerations.
+
+    A drop-in replacement for NBodyProblem, see there for the state layout
+    and the reuse of the returned array.
+    """
+
+    def __init__(self, masses, G, theta=0.5):
+        self.masses = np.asarray(masses, dtype=float)
+        self.G = G
+        self.n = len(self.masses)
+        self.theta = theta
+
+        n = self.n
+        self.dydt = np.empty(6 * n)
+        self.vel = self.dydt[: 3 * n]
+        self.acc = self.dydt[3 * n :].reshape(n, 3)
+
+    def build(self, r):
+        """Octree of the bodies at r, as per level arrays of its cells.
+
+        Returns (order, levels) where order sorts the bodies by Morton key and
+        every level is a dict of the cells' side, mass, center of mass, its
+        offset from the middle, range [first, last) of sorted bodies and range
+        of children.
+        """
+        low, high = r.min(axis=0), r.max(axis=0)
+        side = max((high - low).max(), 1e-300)
+        cells = 1 << DEPTH
+        grid = np.minimum(((r - low) / side * cells).astype(np.int64), cells - 1)
+
+        keys = np.zeros(self.n, dtype=np.int64)
+        for bit in range(DEPTH):
+            for axis in range(3):
+                keys |= ((grid[:, axis] >> bit) & 1) << (3 * bit + axis)
+
+        order = np.argsort(keys, kind='stable')
+        keys = keys[order]
+        grid = grid[order]
+        m = self.masses[order]
+        sorted_r = r[order]
+        mr = m[:, np.newaxis] * sorted_r
+
+        levels = []
+        for level in range(DEPTH + 1):
+            prefix = keys >> (3 * (DEPTH - level))
+            first = np.flatnonzero(np.r_[True, prefix[1:] != prefix[:-1]])
+            last = np.r_[first[1:], self.n]
+            mass = np.add.reduceat(m, first)
+            # Massless cells act with zero weight from their first body
+            center = np.divide(np.add.reduceat(mr, first), mass[:, np.newaxis], out=sorted_r[first],
+                               where=mass[:, np.newaxis] != 0)
+            # Distance of the center of mass from the middle of the cell
+            shift = DEPTH - level
+            middle = low + ((grid[first] >> shift << shift) + (1 << shift) / 2) * (side / cells)
+            offset = np.sqrt(np.einsum('ij,ij->i', center - middle, center - middle))
+            levels.append(dict(side=side / (1 << level), first=first, last=last, mass=mass, center=center,
+                               offset=offset))
+            # Below a level of single bodies there is nothing left to split
+            if len(first) == self.n:
+                break
+
+        for parent, child in zip(levels, levels[1:]):
+            parent['children'] = np.searchsorted(child['first'], parent['first']), \
+                                 np.searchsorted(child['first'], parent['last'])
+        return order, levels
+
+    def accelerations(self, r, out=None):
+        """Accelerations of all bodies for an (N, 3) position array."""
+        if out is None:
+            out = self.acc
+        if self.n < 2:
+            out[:] = 0.0
+            return out
+
+        order, levels = self.build(r)
+        sorted_r = r[order]
+        sorted_m = self.masses[order]
+        # Pairs of sorted body index and cell index on the current level
+        body = np.arange(self.n)
+        cell = np.zeros(self.n, dtype=np.intp)
+        acc = np.zeros((self.n, 3))
+        # Pairs of sorted body indices that interact directly
+        direct = []
+
+        for depth, level in enumerate(levels):
+            first, last = level['first'][cell], level['last'][cell]
+            diff = level['center'][cell] - sorted_r[body]
+            dist2 = np.einsum('ij,ij->i', diff, diff)
+            inside = (first <= body) & (body < last)
+            far = ~inside & (self.theta * (np.sqrt(dist2) - level['offset'][cell]) > level['side'])
+            self.accumulate(acc, body[far], diff[far], dist2[far], level['mass'][cell[far]])
+
+            # Small cells act through their bodies, larger ones are opened
+            near = ~far
+            small = near & ((last - first <= BUCKET) | (depth == len(levels) - 1))
+            direct.append(expand(body[small], first[small], last[small]))
+
+            opened = near & ~small
+            if not opened.any():
+                break
+            body, cell = expand(body[opened], *(i[cell[opened]] for i in level['children']))
+
+        body, other = (np.concatenate(i) for i in zip(*direct))
+        distinct = body != other
+        body, other = body[distinct], other[distinct]
+        diff = sorted_r[other] - sorted_r[body]
+        self.accumulate(acc, body, diff, np.einsum('ij,ij->i', diff, diff), sorted_m[other])
+
+        out[order] = acc
+        return out
+
+    def accumulate(self, acc, body, diff, dist2, mass):
+        """Add the pull of masses at diff from the bodies to their accelerations."""
+        if len(body):
+            weight = self.G * mass / (dist2 * np.sqrt(dist2))
+            for k in range(3):
+                acc[:, k] += np.bincount(body, weights=weight * diff[:, k], minlength=self.n)
+
+    def __call__(self, y, t):
+        n3 = 3 * self.n
+        self.vel[:] = y[n3:]
+        self.accelerations(y[:n3].reshape(self.n, 3), self.acc)
+        return self.dydt
+
+
+def expand(body, start, stop):
+    """Pair every body with each index in its range [start, stop)."""
+    counts = stop - start
+    offsets = np.arange(counts.sum()) - np.repeat(np.cumsum(counts) - counts, counts)
+    return np.repeat(body, counts), np.repeat(start, counts) + offsets
@@ -0,0 +1,197 @@
+"""Run many simulations over a grid of initial conditions.
+
+Each parameter set overrides some of the GUI defaults below and is run
+through simulate() in a pool of worker processes. Only a one row summary of
+every run is sent back and collected into a results table:
+
+    from simulation.batch import grid, sweep, write_csv
+
+    rows = sweep(grid(m2=[1e20, 1e21], v2=[[0, 40, 0], [0, 50, 0]], dt=[0.5, 1]))
+    write_csv(rows, 'results.csv')
+
+or from the command line, with one value per space separated argument and
+vectors written as x,y,z:
+
+    python -m simulation.batch --m2 1e20 1e21 --v2 0,40,0 0,50,0 --out results.csv
+"""
+import argparse
+import csv
+import itertools
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+import numpy as np
+
+from . import invariants
+from .core import G, simulate
+
+# The initial values of the GUI, threads=0 gives the parallel force backend all cores
+DEFAULTS = dict(
+    m1=1e26, m2=1e20, m3=1e10,
+    r1=(0, 0, 0), r2=(0, 3000, 0), r3=(3000, 0, 0),
+    v1=(10, 20, 30), v2=(0, 40, 0), v3=(0, 40, 0),
+    t0=0.0, tf=480.0, dt=0.5,
+    bodies=2, method='auto', collision_distance=0.0, force='direct', theta=0.5, threads=0,
+)
+
+VECTORS = ('r1', 'r2', 'r3', 'v1', 'v2', 'v3')
+
+
+def grid(**axes):
+    """All combinations of the given parameter values, as a list of dicts."""
+    names = list(axes)
+    return [dict(zip(names, values)) for values in itertools.product(*axes.values())]
+
+
+def min_separation(r):
+    """Smallest distance between any two bodies and the sample it occurs at."""
+    n = r.shape[1]
+    best, sample = np.inf, 0
+    for i in range(n - 1):
+        diff = r[:, i + 1 :] - r[:, i : i + 1]
+        dist = np.sqrt(np.einsum('ijk,ijk->ij', diff, diff)).min(axis=1)
+        k = int(dist.argmin())
+        if dist[k] < best:
+            best, sample = float(dist[k]), k
+    return best, sample
+
+
+def inputs(p):
+    """masses, positions, velocities and time grid of a full parameter set."""
+    n = p['bodies']
+    masses = [p[f'm{i}'] for i in range(1, n + 1)]
+    positions = [p[f'r{i}'] for i in range(1, n + 1)]
+    velocities = [p[f'v{i}'] for i in range(1, n + 1)]
+    return masses, positions, velocities, np.arange(p['t0'], p['tf'], p['dt'])
+
+
+def simulate_params(p, **options):
+    """Simulate a full parameter set, returns (trajectory, seconds taken)."""
+    start = time.perf_counter()
+    sim = simulate(*inputs(p), G=G, method=p['method'], events=('collision',),
+                   collision_distance=p['collision_distance'], force=p['force'], theta=p['theta'],
+                   threads=p['threads'] or None, **options)
+    return sim, time.perf_counter() - start
+
+
+def diagnostics(sim, seconds):
+    """Final state, energy error and closest approach of a finished run."""
+    last = sim.available - 1
+    r, v = sim.r_sol[: sim.available], sim.v_sol[: sim.available]
+
+    # Energy in the center of mass frame, the drift of the whole system
+    # would otherwise hide the integration error
+    m = sim.masses
+    v_cog = np.tensordot(v, m, axes=(1, 0)) / m.sum()
+    E = invariants.kinetic_energy(m, v - v_cog[:, np.newaxis, :]).sum(axis=1) + sim.PE[: sim.available]
+    separation, sample = min_separation(r)
+
+    row = dict(
+        samples=sim.available,
+        t_end=float(sim.t[last]),
+        collided=any(event[0] == 'collision' for event in sim.events),
+        energy_drift=float(abs((E[-1] - E[0]) / E[0])),
+        max_energy_error=float(np.abs((E - E[0]) / E[0]).max()),
+        min_separation=separation,
+        min_separation_time=float(sim.t[sample]),
+        seconds=seconds,
+    )
+    for i in range(len(m)):
+        for name, value in zip(('x', 'y', 'z'), r[last, i]):
+            row[f'r{i + 1}{name}'] = float(value)
+        for name, value in zip(('x', 'y', 'z'), v[last, i]):
+            row[f'v{i + 1}{name}'] = float(value)
+    return row
+
+
+def run(params):
+    """Simulate one parameter set and summarize it as a flat dict.
+
+    A run that fails comes back as its parameters and an `error` message.
+    """
+    row = {name: params[name] for name in params}
+    try:
+        sim, seconds = simulate_params(dict(DEFAULTS, **params))
+        row.update(diagnostics(sim, seconds))
+    except (ValueError, RuntimeError, ArithmeticError) as e:
+        # One bad grid point should not cost the rest of the table
+        row['error'] = str(e)
+    return row
+
+
+def sweep(param_sets, workers=None, progress=None):
+    """Run every parameter set, spread over `workers` processes.
+
+    workers defaults to the number of cores. Rows come back in the order of
+    param_sets, progress(done, total) is called as runs finish.
+    """
+    param_sets = list(param_sets)
+    rows = [None] * len(param_sets)
+    with ProcessPoolExecutor(max_workers=workers or os.cpu_count()) as pool:
+        futures = {pool.submit(run, params): i for i, params in enumerate(param_sets)}
+        for done, future in enumerate(as_completed(futures), 1):
+            rows[futures[future]] = future.result()
+            if progress is not None:
+                progress(done, len(param_sets))
+    return rows
+
+
+def write_csv(rows, path):
+    columns = []
+    for row in rows:
+        columns += [name for name in row if name not in columns]
+
+    with open(path, 'w', newline='') as f:
+        writer = csv.DictWriter(f, columns)
+        writer.writeheader()
+        for row in rows:
+            writer.writerow({name: format_value(value) for name, value in row.items()})
+
+
+def format_value(value):
+    if isinstance(value, (tuple, list, np.ndarray)):
+        return ','.join(str(x) for x in value)
+    return value
+
+
+def parse_value(name, text):
+    if name in VECTORS:
+        return tuple(float(x) for x in text.split(','))
+    if name in ('bodies', 'threads'):
+        return int(text)
+    if name in ('method', 'force'):
+        return text
+    return float(text)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Simulate every combination of the given initial conditions.')
+    for name, default in DEFAULTS.items():
+        parser.add_argument(f'--{name.replace("_", "-")}', dest=name, nargs='+', metavar='VALUE',
+                            help=f'default {format_value(default)}')
+    parser.add_argument('--workers', type=int, help='worker processes, defaults to the number of cores')
+    parser.add_argument('--out', default='results.csv', help='results table (CSV)')
+    args = parser.parse_args(argv)
+
+    axes = {name: [parse_value(name, text) for text in getattr(args, name)]
+            for name in DEFAULTS if getattr(args, name) is not None}
+    # Any third body parameter switches to three bodies
+    if 'bodies' not in axes and any(name in axes for name in ('m3', 'r3', 'v3')):
+        axes['bodies'] = [3]
+
+    def progress(done, total):
+        print(f'\r{done}/{total} runs', end='', file=sys.stderr)
+
+    rows = sweep(grid(**axes), workers=args.workers, progress=progress)
+    print(file=sys.stderr)
+    write_csv(rows, args.out)
+    print(f'Wrote {len(rows)} runs to {args.out}')
+    failed = sum('error' in row for row in rows)
+    if failed:
+        print(f'{failed} runs failed, see the error column', file=sys.stderr)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,112 @@
+"""Content-addressed cache of computed trajectories.
+
+A run is identified by a hash of everything that determines its result:
+masses, positions, velocities, the time grid, G and the integrator options.
+The number of bodies follows from the masses, so two- and three-body runs
+of the same inputs get different keys. Recently used trajectories are kept
+in memory, and with a directory also written to disk so they survive a
+restart of the GUI. On disk every run is a directory of memory mapped files,
+see store.py, so loading one reads nothing until samples are asked for.
+"""
+import collections
+import hashlib
+import json
+import os
+import shutil
+import threading
+
+import numpy as np
+
+from . import store
+
+
+def run_key(masses, positions, velocities, t, G, **options):
+    """Hex digest identifying the result of simulate() for these arguments."""
+    digest = hashlib.sha256()
+    for array in (masses, positions, velocities, t):
+        array = np.ascontiguousarray(array, dtype=float)
+        digest.update(repr(array.shape).encode())
+        digest.update(array.tobytes())
+    digest.update(repr(float(G)).encode())
+    digest.update(json.dumps(options, sort_keys=True, default=list).encode())
+    return digest.hexdigest()
+
+
+class TrajectoryCache:
+    """Least recently used trajectories, up to `maxbytes` of states in memory.
+
+    Only states held in RAM count, runs mapped from files cost nothing. The
+    most recent entry is always kept, however large it is.
+
+    With a directory, every trajectory put in the cache is also saved there
+    by a background thread and a miss in memory falls back to the files.
+    Runs that already live in memory mapped scratch files are too large to
+    copy and are only kept in memory. Only finished runs should be stored,
+    the cache hands back exactly what it was given.
+    """
+
+    def __init__(self, maxbytes=1 << 30, directory=None):
+        self.maxbytes = maxbytes
+        self.directory = directory
+        self.entries = collections.OrderedDict()
+        # Background writes of entries to the directory, by key
+        self.writes = {}
+
+    def path(self, key):
+        return os.path.join(self.directory, key)
+
+    def get(self, key):
+        if key in self.entries:
+            self.entries.move_to_end(key)
+            return self.entries[key]
+
+        if self.directory is not None and os.path.exists(self.path(key)):
+            trajectory = store.load(self.path(key))
+            self.remember(key, trajectory)
+            return trajectory
+
+        return None
+
+    def put(self, key, trajectory):
+        self.remember(key, trajectory)
+        self.writes = {k: thread for k, thread in self.writes.items() if thread.is_alive()}
+        if (self.directory is None or trajectory.directory is not None or key in self.writes
+                or os.path.exists(self.path(key))):
+            return
+        thread = threading.Thread(target=self.write, args=(self.path(key), trajectory), daemon=True)
+        self.writes[key] = thread
+        thread.start()
+
+    def write(self, path, trajectory):
+        # Written next to the target first, a half written run is never picked up
+        partial = path + '.partial'
+        try:
+            shutil.rmtree(partial, ignore_errors=True)
+            store.save(partial, trajectory)
+            os.replace(partial, path)
+        except OSError:
+            # The disk copy is optional, the run stays cached in memory
+            shutil.rmtree(partial, ignore_errors=True)
+
+    def wait(self):
+        """Wait until all trajectories put so far are written to disk."""
+        for thread in list(self.writes.values()):
+            thread.join()
+        self.writes.clear()
+
+    def remember(self, key, trajectory):
+        self.entries[key] = trajectory
+        self.entries.move_to_end(key)
+        while len(self.entries) > 1 and sum(nbytes(i) for i in self.entries.values()) > self.maxbytes:
+            self.entries.popitem(last=False)
+
+    def clear(self):
+        self.entries.clear()
+
+
+def nbytes(trajectory):
+    """Bytes of RAM taken by the states of trajectory."""
+    y = trajectory.y
+    if isinstance(y, np.ndarray) and not isinstance(y, np.memmap):
+        return y.nbytes
+    return 0
@@ -0,0 +1,260 @@
+"""Integration of the N-body problem and the quantities derived from it."""
+import numpy as np
+
+from . import invariants, store
+from .integrators import AUTO, integrate
+from .barneshut import BarnesHutProblem
+from .nbody import NBodyProblem, TiledProblem
+
+G = 6.6743e-20 # km^3 kg^(-1)s^(-2)
+
+# Samples integrated per odeint call when reporting progress
+CHUNK = 500
+
+# Backends of the accelerations: direct summation, direct summation split
+# over threads, or the Barnes-Hut tree code
+DIRECT = 'direct'
+PARALLEL = 'parallel'
+BARNES_HUT = 'barnes-hut'
+FORCES = (DIRECT, PARALLEL, BARNES_HUT)
+
+
+class Cancelled(Exception):
+    """Raised from a progress callback to stop simulate() early."""
+
+
+class Derived:
+    """A quantity derived from the states on demand, one window at a time.
+
+    Indexing the first axis, e.g. d[start:stop] or d[num], evaluates
+    function(start, stop) for just those samples. d[:, i] selects along the
+    other axes without evaluating anything, so the per-body views the GUI
+    keeps cost nothing until a frame asks for a window of them.
+
+    A summary of per-block minima and maxima, e.g. from a run file, lets
+    bounds() answer without evaluating the quantity at all.
+    """
+
+    def __init__(self, function, length, select=(), summary=None):
+        self.function = function
+        self.length = length
+        self.select = select
+        self.summary = summary
+
+    def __len__(self):
+        return self.length
+
+    def __getitem__(self, key):
+        if not isinstance(key, tuple):
+            key = (key,)
+        first, rest = key[0], key[1:]
+
+        if isinstance(first, slice) and first == slice(None) and rest:
+            return Derived(self.function, self.length, self.select + (rest,), self.summary)
+
+        if isinstance(first, slice):
+            # Evaluated in ascending order, then stepped, also backwards
+            rows = range(self.length)[first]
+            low = min(rows, default=0)
+            values = self.function(low, max(rows, default=low - 1) + 1)
+            values = values[rows[0] - low :: rows.step][: len(rows)] if rows else values
+        else:
+            num = range(self.length)[first]
+            values = self.function(num, num + 1)
+
+        for select in self.select + (rest,):
+            values = values[(slice(None),) + select]
+        return values if isinstance(first, slice) else values[0]
+
+    def __array__(self, dtype=None, copy=None):
+        return np.asarray(self[:], dtype=dtype)
+
+    def summarize(self, block, lows, highs):
+        """Attach the minima and maxima of every `block` samples."""
+        self.summary = (block, lows, highs)
+
+    def bounds(self, start, stop):
+        """Minimum and maximum over samples [start, stop), or None when
+        there is no summary. Whole blocks are covered, so the result may be
+        slightly wider than the window."""
+        if self.summary is None:
+            return None
+        block, lows, highs = self.summary
+        blocks = slice(start // block, -(-stop // block))
+        low, high = lows[blocks].min(axis=0), highs[blocks].max(axis=0)
+        for select in self.select:
+            low, high = low[select], high[select]
+        return low, high
+
+
+class Trajectory:
+    """Result of simulate().
+
+    Per-body arrays are indexed [sample, body, xyz]:
+
+    r_sol, v_sol  positions and velocities in the frame of the inputs
+    t_sol         positions relative to the center of gravity
+    cog_sol       center of gravity, indexed [sample, xyz]
+    cog_sol_t     center of gravity in its own frame (zero up to rounding)
+
+    Diagnostics, see invariants.py:
+
+    speed, KE     speed and kinetic energy of every body, indexed [sample, body]
+    PE, totalE    potential and total energy of the system, indexed [sample]
+    momentum      total linear momentum, indexed [sample, xyz]
+    angular_momentum  total angular momentum about the origin, [sample, xyz]
+
+    Only the states y are stored, r_sol and v_sol are views of them and
+    everything else is Derived, computed for the window of samples that is
+    asked for. y may be a memory mapped file, see store.py, in which case
+    nothing but the requested windows is ever in memory.
+
+    The arrays cover the whole time grid from the start, but only the first
+    `available` samples are valid while a run is still being integrated, or
+    after it ended early on a collision. Detected events are collected in
+    `events` as (name, time, i, j) tuples.
+    """
+
+    def __init__(self, t, masses, y, G=G):
+        self.t = t
+        self.masses = masses = np.asarray(masses, dtype=float)
+        self.G = G
+        self.y = y
+        self.n = n = len(masses)
+        self.available = 0
+        self.events = []
+        # Directory of the files backing y, if any
+        self.directory = None
+
+        def derived(function):
+            return Derived(function, len(t))
+
+        if isinstance(y, np.ndarray):
+            self.r_sol = y[:, : 3 * n].reshape(-1, n, 3)
+            self.v_sol = y[:, 3 * n :].reshape(-1, n, 3)
+        else:
+            # States read in windows, e.g. from a compressed run file
+            self.r_sol = derived(lambda a, b: y[a:b, : 3 * n].reshape(-1, n, 3))
+            self.v_sol = derived(lambda a, b: y[a:b, 3 * n :].reshape(-1, n, 3))
+
+        self.cog_sol = derived(self.cog)
+        self.t_sol = derived(lambda a, b: self.r_sol[a:b] - self.cog(a, b)[:, np.newaxis, :])
+        self.cog_sol_t = derived(lambda a, b: np.tensordot(self.t_sol[a:b], masses, axes=(1, 0)) / masses.sum())
+
+        self.speed = derived(lambda a, b: invariants.speeds(self.v_sol[a:b]))
+        self.KE = derived(lambda a, b: invariants.kinetic_energy(masses, self.v_sol[a:b]))
+        self.PE = derived(lambda a, b: invariants.potential_energy(masses, self.r_sol[a:b], G))
+        self.totalE = derived(lambda a, b: invariants.total_energy(masses, self.r_sol[a:b], self.v_sol[a:b], G))
+        self.momentum = derived(lambda a, b: invariants.linear_momentum(masses, self.v_sol[a:b]))
+        self.angular_momentum = derived(lambda a, b: invariants.angular_momentum(masses, self.r_sol[a:b], self.v_sol[a:b]))
+
+    def cog(self, start, stop):
+        """Center of mass of samples [start, stop)."""
+        return np.tensordot(self.r_sol[start:stop], self.masses, axes=(1, 0)) / self.masses.sum()
+
+    def fill(self, start, stop):
+        """Mark samples [start, stop) of y as computed."""
+        self.available = stop
+
+
+def force_model(masses, G, force=DIRECT, theta=0.5, threads=None):
+    """The derivative of the N-body problem with the given force backend."""
+    if force == DIRECT:
+        return NBodyProblem(masses, G)
+    if force == PARALLEL:
+        return TiledProblem(masses, G, threads)
+    if force == BARNES_HUT:
+        return BarnesHutProblem(masses, G, theta)
+    raise ValueError(f'Unknown force backend {force!r}, use one of {", ".join(FORCES)}')
+
+
+def stream(masses, positions, velocities, t, G=G, chunk=CHUNK, method=AUTO, events=(), collision_distance=0.0,
+           substeps=1, directory=None, force=DIRECT, theta=0.5, threads=None):
+    """Integrate the time grid t in pieces of `chunk` samples.
+
+    Yields (trajectory, available) after every piece. The trajectory arrays
+    are reserved for the whole grid up front, but their memory is only
+    touched as samples are written, and the first samples are ready after a
+    single chunk however long the grid is. Closing the generator stops the
+    integration.
+
+    method selects the backend from integrators.METHODS and events the event
+    functions detected by the solve_ivp methods, see integrators.integrate.
+    substeps sets the number of fixed steps per sample of the symplectic
+    methods.
+
+    force selects how the accelerations are computed, by direct summation,
+    by direct summation on `threads` threads (all cores by default) or with
+    the Barnes-Hut tree code with opening angle theta. The last two pay off
+    for thousands of bodies. The closed form kepler method needs no
+    accelerations and ignores it.
+
+    With a directory the states are written to memory mapped files there
+    instead of an array in memory, for runs larger than the RAM. They can be
+    opened again later with store.load. An empty time grid raises
+    ValueError.
+    """
+    masses = np.asarray(masses, dtype=float)
+    t = np.asarray(t)
+    if len(t) == 0:
+        raise ValueError('The time grid is empty, the final time must be after the start time')
+    y0 = np.concatenate((np.ravel(positions), np.ravel(velocities))).astype(float)
+    model = force_model(masses, G, force, theta, threads)
+    options = dict(method=method, events=events, collision_distance=collision_distance, substeps=substeps)
+
+    if directory is None:
+        trajectory = Trajectory(t, masses, np.empty((len(t), len(y0))), G)
+    else:
+        trajectory = store.create(directory, t, masses, G, len(y0))
+
+    try:
+        start = 0
+        while start < len(t):
+            stop = min(start + chunk, len(t))
+            if start == 0:
+                y, found = integrate(model, y0, t[:stop], **options)
+            else:
+                # Continue from the last computed sample, which is returned again
+                y, found = integrate(model, trajectory.y[start - 1], t[start - 1 : stop], **options)
+                y = y[1:]
+
+            trajectory.y[start : start + len(y)] = y
+            trajectory.fill(start, start + len(y))
+            trajectory.events += found
+            yield trajectory, trajectory.available
+
+            # A terminal event cut the chunk short
+            if trajectory.available < stop:
+                return
+            start = stop
+    finally:
+        # Also record how far a cancelled run got
+        if directory is not None:
+            store.flush(trajectory)
+
+
+def simulate(masses, positions, velocities, t, G=G, progress=None, chunk=CHUNK, **options):
+    """Integrate the bodies over the time grid t.
+
+    masses has shape (N,), positions and velocities (N, 3) in km and km/s.
+    The remaining options select the integrator, see stream().
+
+    Without a progress callback the whole grid is integrated in one go.
+    Otherwise the run is streamed and progress(trajectory, available) is
+    called after each chunk, so callers can show or play the samples
+    computed so far. Raising Cancelled from the callback stops the run, the
+    trajectory is then returned with the `available` samples computed so far.
+    """
+    if progress is None:
+        chunk = max(len(t), 1)
+
+    runs = stream(masses, positions, velocities, t, G=G, chunk=chunk, **options)
+    try:
+        for trajectory, available in runs:
+            if progress is not None:
+                progress(trajectory, available)
+    except Cancelled:
+        # Closing the generator records how far a run on disk got
+        runs.close()
+
+    return trajectory
@@ -0,0 +1,67 @@
+"""Integrate many nearby initial conditions together.
+
+Calling simulate() once per member pays the Python overhead of every step
+and force evaluation M times. Here the members are stacked into (M, N, 3)
+arrays and advanced together by the fixed-step symplectic methods, so each
+step is a handful of array operations over the whole ensemble:
+
+    positions, velocities = perturbed(positions, velocities, 1000, 1.0, 0.01)
+    members = simulate_ensemble(masses, positions, velocities, t)
+    members[k].r_sol, members[k].cog_sol
+
+Every member comes back as a Trajectory, the same result simulate() gives.
+"""
+import numpy as np
+
+from . import symplectic
+from .core import G, Trajectory
+from .nbody import EnsembleProblem
+
+METHODS = tuple(symplectic.COMPOSITIONS)
+
+
+def perturbed(positions, velocities, count, position_scale, velocity_scale, seed=None):
+    """count copies of one initial state with normal random offsets.
+
+    The offsets have standard deviations position_scale (km) and
+    velocity_scale (km/s) per component. Member 0 is left unperturbed as
+    the reference. Returns positions and velocities of shape (count, N, 3).
+    """
+    rng = np.random.default_rng(seed)
+    positions = np.asarray(positions, dtype=float)
+    velocities = np.asarray(velocities, dtype=float)
+
+    r = positions + rng.normal(scale=position_scale, size=(count,) + positions.shape)
+    v = velocities + rng.normal(scale=velocity_scale, size=(count,) + velocities.shape)
+    r[0], v[0] = positions, velocities
+    return r, v
+
+
+def simulate_ensemble(masses, positions, velocities, t, G=G, method='yoshida4', substeps=1):
+    """Integrate M systems of N bodies over the time grid t at once.
+
+    positions and velocities have shape (M, N, 3), masses (M, N) or (N,)
+    when shared. method is one of METHODS, taking `substeps` steps between
+    samples. Returns a list of M trajectories.
+    """
+    if method not in METHODS:
+        raise ValueError(f'ensembles are integrated with one of {", ".join(METHODS)}, not {method}')
+
+    positions = np.asarray(positions, dtype=float)
+    velocities = np.asarray(velocities, dtype=float)
+    members, n = positions.shape[:2]
+    t = np.asarray(t)
+
+    model = EnsembleProblem(masses, G, members)
+    y0 = np.concatenate((positions.reshape(members, -1), velocities.reshape(members, -1)), axis=1)
+    y = symplectic.leapfrog(model, y0, t, symplectic.COMPOSITIONS[method], substeps)
+
+    # One contiguous [sample, state] block per member, as simulate() has
+    y = np.ascontiguousarray(y.transpose(1, 0, 2))
+
+    trajectories = []
+    for k in range(members):
+        trajectory = Trajectory(t, model.masses[k], y[k], G)
+        trajectory.fill(0, len(t))
+        trajectories.append(trajectory)
+    return trajectories
@@ -0,0 +1,120 @@
+"""Integrator backends behind stream() and simulate().
+
+Every backend integrates a model from the state at t[0] and returns the
+state at every sample of t. Besides odeint on the fixed grid, the adaptive
+solve_ivp methods pick their own steps and the grid is sampled from their
+dense output, so slow phases of an orbit cost few steps while close
+approaches are still resolved. The symplectic methods take fixed steps and
+keep the energy error bounded over many orbits, see symplectic.py.
+
+Two bodies need no integration at all: kepler propagates them in closed
+form, and auto picks it whenever there are two bodies and odeint otherwise.
+"""
+import numpy as np
+
+from . import kepler, symplectic
+
+AUTO = 'auto'
+ODEINT = 'odeint'
+KEPLER = 'kepler'
+METHODS = (AUTO, ODEINT, KEPLER, 'RK45', 'DOP853', 'LSODA') + symplectic.METHODS
+
+EVENTS = ('collision', 'periapsis')
+
+
+def pairs(n):
+    return [(i, j) for i in range(n) for j in range(i + 1, n)]
+
+
+def make_events(n, names, collision_distance=0.0):
+    """Event functions for solve_ivp and a (name, i, j) label for each.
+
+    collision  the closest pair gets within collision_distance km, ends the run
+    periapsis  a pair passes its point of closest approach
+    """
+    events, labels = [], []
+
+    if 'collision' in names and collision_distance > 0:
+        def collision(t, y):
+            r = y[: 3 * n].reshape(n, 3)
+            diff = r[np.newaxis, :, :] - r[:, np.newaxis, :]
+            dist = np.sqrt(np.einsum('ijk,ijk->ij', diff, diff))
+            np.fill_diagonal(dist, np.inf)
+            return dist.min() - collision_distance
+        collision.terminal = True
+        collision.direction = -1
+        events.append(collision)
+        labels.append(('collision', None, None))
+
+    if 'periapsis' in names:
+        for i, j in pairs(n):
+            # d/dt |r_j - r_i| changes sign from - to + at closest approach
+            def periapsis(t, y, i=i, j=j):
+                return np.dot(y[3 * j : 3 * j + 3] - y[3 * i : 3 * i + 3],
+                              y[3 * (n + j) : 3 * (n + j) + 3] - y[3 * (n + i) : 3 * (n + i) + 3])
+            periapsis.direction = 1
+            events.append(periapsis)
+            labels.append(('periapsis', i, j))
+
+    return events, labels
+
+
+def closest_pair(y, n):
+    r = y[: 3 * n].reshape(n, 3)
+    return min(pairs(n), key=lambda p: np.linalg.norm(r[p[1]] - r[p[0]]))
+
+
+def integrate(model, y0, t, method=AUTO, events=(), collision_distance=0.0, rtol=1e-9, atol=1e-6,
+              substeps=1):
+    """Integrate model from y0 = y(t[0]) over the samples t.
+
+    Returns (y, found) where y holds the state at each sample and found is a
+    list of (name, time, i, j) events. A collision ends the run early, in
+    which case y only covers the samples before it. Events are only
+    detected by the solve_ivp methods. The symplectic methods take
+    `substeps` steps between samples.
+    """
+    if method == AUTO:
+        method = KEPLER if model.n == 2 else ODEINT
+
+    if method == KEPLER:
+        if model.n != 2:
+            raise ValueError('the kepler method needs exactly two bodies')
+        y = kepler.propagate(model.masses, y0, t, model.G)
+        if np.all(np.isfinite(y)):
+            return y, []
+        # Bodies that fall straight into each other, leave it to odeint
+        method = ODEINT
+
+    if method == ODEINT:
+        # scipy.integrate is slow to import, keep it out of package import time
+        from scipy.integrate import odeint
+        return odeint(model, y0, t), []
+
+    if method in symplectic.METHODS:
+        return symplectic.integrate(model, y0, t, method, substeps), []
+
+    from scipy.integrate import solve_ivp
+
+    if len(t) < 2:
+        return np.asarray(y0, dtype=float)[np.newaxis, :], []
+
+    n = model.n
+    functions, labels = make_events(n, events, collision_distance)
+
+    # The model reuses its output buffer, solve_ivp keeps references to it
+    sol = solve_ivp(lambda time, y: model(y, time).copy(), (t[0], t[-1]), y0, method=method,
+                    dense_output=True, events=functions or None, rtol=rtol, atol=atol)
+    if sol.status < 0:
+        raise RuntimeError(sol.message)
+
+    found = []
+    for (name, i, j), times, states in zip(labels, sol.t_events or [], sol.y_events or []):
+        for time, state in zip(times, states):
+            if name == 'collision':
+                i, j = closest_pair(state, n)
+            found.append((name, float(time), i, j))
+    found.sort(key=lambda event: event[1])
+
+    samples = t if sol.status != 1 else t[t <= sol.t[-1]]
+    return sol.sol(samples).T, found
@@ -0,0 +1,42 @@
+"""Energy and momentum of N-body states.
+
+All functions take positions and velocities shaped (..., N, 3), so a
+single state, a trajectory indexed [sample, body, xyz] or a batch of
+trajectories all work, and return one value per leading index.
+"""
+import numpy as np
+
+
+def speeds(v):
+    """Speed of every body, shape (..., N)."""
+    return np.sqrt(np.einsum('...jk,...jk->...j', v, v))
+
+
+def kinetic_energy(masses, v):
+    """Kinetic energy of every body, shape (..., N)."""
+    return 0.5 * masses * np.einsum('...jk,...jk->...j', v, v)
+
+
+def potential_energy(masses, r, G):
+    """Gravitational potential energy of the whole system, shape (...)."""
+    PE = np.zeros(r.shape[:-2])
+    # Body i with all bodies after it, the loop only runs over the N bodies
+    for i in range(len(masses) - 1):
+        diff = r[..., i + 1 :, :] - r[..., i : i + 1, :]
+        dist = np.sqrt(np.einsum('...jk,...jk->...j', diff, diff))
+        PE -= G * masses[i] * np.sum(masses[i + 1 :] / dist, axis=-1)
+    return PE
+
+
+def total_energy(masses, r, v, G):
+    return kinetic_energy(masses, v).sum(axis=-1) + potential_energy(masses, r, G)
+
+
+def linear_momentum(masses, v):
+    """Total linear momentum, shape (..., 3)."""
+    return np.einsum('j,...jk->...k', masses, v)
+
+
+def angular_momentum(masses, r, v):
+    """Total angular momentum about the origin, shape (..., 3)."""
+    return np.einsum('j,...jk->...k', masses, np.cross(r, v))
@@ -0,0 +1,139 @@
+"""Two-body Kepler motion in universal variables.
+
+kepler_step advances any number of independent Kepler orbits by a time dt
+at once, for elliptic, parabolic and hyperbolic orbits alike. propagate uses
+it to solve the two-body problem in closed form.
+"""
+import numpy as np
+
+
+def stumpff(z):
+    """Stumpff functions C(z) and S(z), elementwise."""
+    z = np.asarray(z, dtype=float)
+    C = np.empty_like(z)
+    S = np.empty_like(z)
+
+    # Series around zero, the closed forms cancel badly there
+    small = np.abs(z) < 1e-3
+    zs = z[small]
+    C[small] = 1 / 2 - zs / 24 + zs ** 2 / 720
+    S[small] = 1 / 6 - zs / 120 + zs ** 2 / 5040
+
+    pos = z >= 1e-3
+    sz = np.sqrt(z[pos])
+    C[pos] = (1 - np.cos(sz)) / z[pos]
+    S[pos] = (sz - np.sin(sz)) / sz ** 3
+
+    neg = z <= -1e-3
+    sz = np.sqrt(-z[neg])
+    C[neg] = (np.cosh(sz) - 1) / -z[neg]
+    S[neg] = (np.sinh(sz) - sz) / sz ** 3
+
+    return C, S
+
+
+def kepler_step(mu, r0, v0, dt, tol=1e-13, maxiter=50):
+    """Propagate relative positions r0 and velocities v0 (shape (K, 3)) of K
+    Kepler orbits with gravitational parameters mu (shape (K,)) by dt.
+
+    dt may be a scalar or have shape (K,). Returns the new (r, v).
+    """
+    mu = np.asarray(mu, dtype=float)
+    r0 = np.asarray(r0, dtype=float)
+    v0 = np.asarray(v0, dtype=float)
+    dt = np.broadcast_to(np.asarray(dt, dtype=float), mu.shape).copy()
+
+    r0n = np.linalg.norm(r0, axis=-1)
+    vr0 = np.einsum('ij,ij->i', r0, v0) / r0n
+    alpha = 2 / r0n - np.einsum('ij,ij->i', v0, v0) / mu
+    smu = np.sqrt(mu)
+
+    # Whole periods of bound orbits change nothing, drop them so the solver
+    # starts close to the answer even for very long steps
+    bound = alpha > 0
+    period = 2 * np.pi / np.sqrt(mu[bound] * alpha[bound] ** 3)
+    dt[bound] = np.fmod(dt[bound], period)
+
+    # Laguerre-Conway iteration, which unlike Newton converges from these
+    # crude starting guesses for hyperbolic and near radial orbits too
+    a = r0n * vr0 / smu
+    b = 1 - alpha * r0n
+
+    def residual(chi):
+        z = alpha * chi ** 2
+        C, S = stumpff(z)
+        return a * chi ** 2 * C + b * chi ** 3 * S + r0n * chi - smu * dt
+
+    chi = np.where(alpha > 0, smu * alpha * dt, smu * dt / r0n)
+
+    # The universal anomaly only grows logarithmically with time on hyperbolic
+    # orbits, so far out the guess of Vallado, Fundamentals of Astrodynamics
+    # (algorithm 8) is much closer. Keep whichever guess fits better.
+    hyper = alpha < 0
+    if np.any(hyper):
+        with np.errstate(all='ignore'):
+            sa = np.sqrt(-1 / alpha[hyper])
+            sdt = np.sign(dt[hyper])
+            guess = sdt * sa * np.log(-2 * mu[hyper] * alpha[hyper] * dt[hyper]
+                                      / (r0n[hyper] * vr0[hyper] + sdt * np.sqrt(mu[hyper]) * sa * b[hyper]))
+            full = chi.copy()
+            full[hyper] = guess
+            # The circular guess overflows the Stumpff functions far out
+            rf, rc = np.abs(residual(full)), np.abs(residual(chi))
+            better = np.isfinite(rf) & ~(rf >= rc)
+        chi[better] = full[better]
+    order = 5
+    for _ in range(maxiter):
+        z = alpha * chi ** 2
+        C, S = stumpff(z)
+        F = a * chi ** 2 * C + b * chi ** 3 * S + r0n * chi - smu * dt
+        dF = a * chi * (1 - z * S) + b * chi ** 2 * C + r0n
+        ddF = a * (1 - z * C) + b * chi * (1 - z * S)
+        root = np.sqrt(np.abs((order - 1) ** 2 * dF ** 2 - order * (order - 1) * F * ddF))
+        delta = order * F / (dF + np.sign(dF) * root)
+        chi -= delta
+        if np.all(np.abs(delta) <= tol * np.maximum(np.abs(chi), 1)):
+            break
+
+    z = alpha * chi ** 2
+    C, S = stumpff(z)
+
+    f = 1 - chi ** 2 / r0n * C
+    g = dt - chi ** 3 / smu * S
+    r = f[:, np.newaxis] * r0 + g[:, np.newaxis] * v0
+    rn = np.linalg.norm(r, axis=-1)
+
+    fdot = smu / (rn * r0n) * (z * S - 1) * chi
+    gdot = 1 - chi ** 2 / rn * C
+    v = fdot[:, np.newaxis] * r0 + gdot[:, np.newaxis] * v0
+
+    return r, v
+
+
+def propagate(masses, y0, t, G):
+    """Closed-form solution of the two-body problem on the samples t.
+
+    y0 = y(t[0]) in the usual [r1, r2, v1, v2] layout. The center of mass
+    moves uniformly and the relative orbit is solved for every sample at
+    once with kepler_step, so the cost is a few array operations per sample
+    however long the time span is. Returns the states, shape (len(t), 12).
+    """
+    m1, m2 = masses
+    M = m1 + m2
+    t = np.asarray(t, dtype=float)
+    r1, r2, v1, v2 = np.asarray(y0, dtype=float).reshape(4, 3)
+
+    R = (m1 * r1 + m2 * r2) / M
+    V = (m1 * v1 + m2 * v2) / M
+    dt = t - t[0]
+
+    shape = (len(t), 3)
+    r, v = kepler_step(np.full(len(t), G * M), np.broadcast_to(r2 - r1, shape), np.broadcast_to(v2 - v1, shape), dt)
+
+    y = np.empty((len(t), 12))
+    cog = R + dt[:, np.newaxis] * V
+    y[:, 0:3] = cog - m2 / M * r
+    y[:, 3:6] = cog + m1 / M * r
+    y[:, 6:9] = V - m2 / M * v
+    y[:, 9:12] = V + m1 / M * v
+    return y
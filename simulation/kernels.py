@@ -0,0 +1,103 @@
+"""Compiled kernels of the N-body problem, used when numba is installed.
+
+The vectorized NumPy code in nbody and symplectic spends most of its time
+on the Python call and the temporary arrays of every evaluation when there
+are only a few bodies. These kernels do the same work in plain loops that
+numba compiles in nopython mode, cached to disk so only the first run
+pays for the compilation:
+
+    accelerations   the pairwise sum, each pair visited once
+    derivative      the right hand side for odeint, in one call
+    leapfrog        the whole composed leapfrog loop of symplectic.leapfrog
+    tile            the accelerations of a range of bodies, for TiledProblem
+
+JIT tells whether numba was found at import. NBodyProblem uses the kernels
+then unless created with jit=False, otherwise everything runs on NumPy as
+before; numba is not a requirement.
+"""
+import numpy as np
+
+try:
+    import numba
+except ImportError:
+    numba = None
+
+JIT = numba is not None
+
+
+def jit(function):
+    # Without the GIL the kernels can run in several threads at once
+    if numba is None:
+        return function
+    return numba.njit(cache=True, nogil=True)(function)
+
+
+@jit
+def accelerations(r, Gm, out):
+    n = r.shape[0]
+    out[:] = 0.0
+    for i in range(n):
+        for j in range(i + 1, n):
+            dx = r[j, 0] - r[i, 0]
+            dy = r[j, 1] - r[i, 1]
+            dz = r[j, 2] - r[i, 2]
+            d2 = dx * dx + dy * dy + dz * dz
+            inverse = 1.0 / (d2 * np.sqrt(d2))
+            out[i, 0] += Gm[j] * inverse * dx
+            out[i, 1] += Gm[j] * inverse * dy
+            out[i, 2] += Gm[j] * inverse * dz
+            out[j, 0] -= Gm[i] * inverse * dx
+            out[j, 1] -= Gm[i] * inverse * dy
+            out[j, 2] -= Gm[i] * inverse * dz
+    return out
+
+
+@jit
+def derivative(y, Gm, out):
+    n = Gm.shape[0]
+    out[: 3 * n] = y[3 * n :]
+    accelerations(y[: 3 * n].reshape(n, 3), Gm, out[3 * n :].reshape(n, 3))
+    return out
+
+
+@jit
+def leapfrog(y0, Gm, t, weights, substeps, y):
+    n = Gm.shape[0]
+    r = y0[: 3 * n].reshape(n, 3).copy()
+    v = y0[3 * n :].reshape(n, 3).copy()
+    a = np.empty((n, 3))
+    accelerations(r, Gm, a)
+    y[0] = y0
+
+    for k in range(1, len(t)):
+        h = (t[k] - t[k - 1]) / substeps
+        for _ in range(substeps):
+            for w in weights:
+                v += (0.5 * w * h) * a
+                r += (w * h) * v
+                accelerations(r, Gm, a)
+                v += (0.5 * w * h) * a
+        y[k, : 3 * n] = r.ravel()
+        y[k, 3 * n :] = v.ravel()
+    return y
+
+
+@jit
+def tile(r, Gm, out, start, stop):
+    n = r.shape[0]
+    for i in range(start, stop):
+        ax = ay = az = 0.0
+        for j in range(n):
+            if j == i:
+                continue
+            dx = r[j, 0] - r[i, 0]
+            dy = r[j, 1] - r[i, 1]
+            dz = r[j, 2] - r[i, 2]
+            d2 = dx * dx + dy * dy + dz * dz
+            weight = Gm[j] / (d2 * np.sqrt(d2))
+            ax += weight * dx
+            ay += weight * dy
+            az += weight * dz
+        out[i, 0] = ax
+        out[i, 1] = ay
+        out[i, 2] = az
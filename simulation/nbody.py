@@ -0,0 +1,185 @@
+"""Vectorized right-hand side of the gravitational N-body problem.
+
+The state vector keeps the layout the GUIs have always used: the positions of
+all bodies followed by their velocities,
+
+    y = [r1, r2, ..., rN, v1, v2, ..., vN]
+
+so the two and three body cases are just N = 2 and N = 3.
+"""
+import os
+import weakref
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+from . import kernels
+
+# Bodies per tile of TiledProblem, few so that all cores get tiles from
+# about a thousand bodies on
+ROWS = 16
+
+# Pairs evaluated at most by one tile, which bounds its temporaries
+TILE = 1 << 18
+
+
+class NBodyProblem:
+    """Callable derivative dy/dt = f(y, t) for use with odeint.
+
+    All pairwise interactions are computed with broadcasting over an (N, N, 3)
+    separation array. The temporaries and the returned array are allocated
+    once and reused between calls, so callers that keep the result around
+    must copy it.
+
+    With numba installed the compiled loops of kernels are used instead,
+    jit=False keeps the NumPy version.
+    """
+
+    def __init__(self, masses, G, jit=None):
+        self.masses = np.asarray(masses, dtype=float)
+        self.G = G
+        self.n = len(self.masses)
+        self.Gm = G * self.masses
+        self.jit = kernels.JIT if jit is None else jit
+        if self.jit and kernels.numba is None:
+            raise ValueError('jit=True needs numba')
+
+        n = self.n
+        self.diff = np.empty((n, n, 3))
+        self.dist = np.empty((n, n))
+        self.sqrt = np.empty((n, n))
+        self.diagonal = self.dist.reshape(-1)[:: n + 1]
+
+        # The derivative is written in place through these views
+        self.dydt = np.empty(6 * n)
+        self.vel = self.dydt[: 3 * n]
+        self.acc = self.dydt[3 * n :].reshape(n, 3)
+
+    def accelerations(self, r, out=None):
+        """Accelerations of all bodies for an (N, 3) position array."""
+        if out is None:
+            out = self.acc
+        if self.jit:
+            return kernels.accelerations(r, self.Gm, out)
+
+        # diff[i, j] = r_j - r_i points from body i towards body j
+        np.subtract(r[np.newaxis, :, :], r[:, np.newaxis, :], out=self.diff)
+
+        np.einsum('ijk,ijk->ij', self.diff, self.diff, out=self.dist)
+        np.sqrt(self.dist, out=self.sqrt)
+        self.dist *= self.sqrt
+        # No self interaction
+        self.diagonal[:] = np.inf
+
+        np.divide(self.Gm, self.dist, out=self.dist)
+        np.einsum('ij,ijk->ik', self.dist, self.diff, out=out)
+        return out
+
+    def __call__(self, y, t):
+        if self.jit:
+            return kernels.derivative(y, self.Gm, self.dydt)
+        n3 = 3 * self.n
+        self.vel[:] = y[n3:]
+        self.accelerations(y[:n3].reshape(self.n, 3), self.acc)
+        return self.dydt
+
+
+class TiledProblem:
+    """NBodyProblem for thousands of bodies, evaluated by a pool of threads.
+
+    The bodies are split into tiles of ROWS consecutive bodies, fewer when
+    that would exceed TILE pairs, each tile sums the pull of all bodies on
+    its own and writes only its rows, so the temporaries stay at most TILE
+    pairs per thread instead of N^2 and the tiles run in parallel, NumPy
+    and the compiled kernels release the GIL.
+    The tiles depend on N alone and every sum is taken in the same order
+    whatever the number of threads, so results are bitwise reproducible.
+    """
+
+    def __init__(self, masses, G, threads=None, jit=None):
+        self.masses = np.asarray(masses, dtype=float)
+        self.G = G
+        self.n = n = len(self.masses)
+        self.Gm = G * self.masses
+        self.jit = kernels.JIT if jit is None else jit
+        if self.jit and kernels.numba is None:
+            raise ValueError('jit=True needs numba')
+
+        rows = max(min(ROWS, TILE // max(n, 1)), 1)
+        self.tiles = [(start, min(start + rows, n)) for start in range(0, n, rows)]
+        self.threads = threads or os.cpu_count()
+        self.pool = ThreadPoolExecutor(self.threads) if self.threads > 1 and len(self.tiles) > 1 else None
+        if self.pool is not None:
+            weakref.finalize(self, self.pool.shutdown, wait=False)
+
+        self.dydt = np.empty(6 * n)
+        self.vel = self.dydt[: 3 * n]
+        self.acc = self.dydt[3 * n :].reshape(n, 3)
+
+    def tile(self, r, out, start, stop):
+        if self.jit:
+            kernels.tile(r, self.Gm, out, start, stop)
+            return
+
+        diff = r[np.newaxis, :, :] - r[start:stop, np.newaxis, :]
+        dist = np.einsum('ijk,ijk->ij', diff, diff)
+        dist *= np.sqrt(dist)
+        rows = np.arange(stop - start)
+        dist[rows, rows + start] = np.inf
+        np.divide(self.Gm, dist, out=dist)
+        np.einsum('ij,ijk->ik', dist, diff, out=out[start:stop])
+
+    def accelerations(self, r, out=None):
+        """Accelerations of all bodies for an (N, 3) position array."""
+        if out is None:
+            out = self.acc
+        if self.pool is None:
+            for start, stop in self.tiles:
+                self.tile(r, out, start, stop)
+        else:
+            # list() waits for all tiles and raises the first error
+            list(self.pool.map(lambda bounds: self.tile(r, out, *bounds), self.tiles))
+        return out
+
+    def __call__(self, y, t):
+        n3 = 3 * self.n
+        self.vel[:] = y[n3:]
+        self.accelerations(y[:n3].reshape(self.n, 3), self.acc)
+        return self.dydt
+
+
+class EnsembleProblem:
+    """Accelerations of M independent N-body systems at once.
+
+    Positions are stacked into an (M, N, 3) array and masses into (M, N), or
+    (N,) when all members share them. Like NBodyProblem the temporaries are
+    allocated once, here with an extra leading axis.
+    """
+
+    def __init__(self, masses, G, members):
+        self.masses = np.broadcast_to(np.asarray(masses, dtype=float), (members, np.shape(masses)[-1]))
+        self.G = G
+        self.members = members
+        self.n = n = self.masses.shape[1]
+        self.Gm = G * self.masses[:, np.newaxis, :]
+
+        self.diff = np.empty((members, n, n, 3))
+        self.dist = np.empty((members, n, n))
+        self.sqrt = np.empty((members, n, n))
+        self.diagonal = np.arange(n)
+
+    def accelerations(self, r, out=None):
+        """Accelerations for an (M, N, 3) position array."""
+        if out is None:
+            out = np.empty_like(r)
+
+        np.subtract(r[:, np.newaxis, :, :], r[:, :, np.newaxis, :], out=self.diff)
+
+        np.einsum('mijk,mijk->mij', self.diff, self.diff, out=self.dist)
+        np.sqrt(self.dist, out=self.sqrt)
+        self.dist *= self.sqrt
+        self.dist[:, self.diagonal, self.diagonal] = np.inf
+
+        np.divide(self.Gm, self.dist, out=self.dist)
+        np.einsum('mij,mijk->mik', self.dist, self.diff, out=out)
+        return out
@@ -0,0 +1,188 @@
+"""Saved runs: parameters and trajectory in one compressed .npz file.
+
+The states are split into chunks of `chunk` samples, each compressed as a
+separate member of the archive, so opening a run only reads the small
+members and a frame only decompresses the chunks it touches:
+
+    format      file format version
+    params      JSON of free-form parameters, e.g. the GUI inputs
+    masses, G, available, events (JSON)
+    t           the time grid, or t_start, t_step and samples for a uniform one
+    chunk       samples per chunk
+    y_<i>       states of chunk i, [sample, r1 .. rN, v1 .. vN], stored as
+                byte planes indexed [byte, column, sample], see shuffle()
+    lows_<q>, highs_<q>
+                minimum and maximum of quantity q of the Trajectory per chunk,
+                so plot limits are known without reading the states
+
+save() and load() are the whole interface:
+
+    save('run.npz', trajectory, params={'mode': 'two body'})
+    trajectory, params = load('run.npz')
+"""
+import functools
+import json
+import zipfile
+
+import numpy as np
+
+FORMAT = 1
+
+CHUNK = 1 << 16
+
+# Quantities of a Trajectory whose per-chunk bounds are stored
+SUMMARIZED = ('r_sol', 'v_sol', 't_sol', 'cog_sol', 'cog_sol_t',
+              'speed', 'KE', 'PE', 'totalE', 'momentum', 'angular_momentum')
+
+
+def save(path, trajectory, params=None, chunk=CHUNK):
+    """Write the computed samples of trajectory and params to path.
+
+    The states are read, summarized, compressed and written one chunk at a
+    time, so saving a run on disk needs memory for a chunk, not the run.
+    """
+    from .core import Trajectory
+
+    available = trajectory.available
+    t = trajectory.t
+    lows = {name: [] for name in SUMMARIZED}
+    highs = {name: [] for name in SUMMARIZED}
+
+    with zipfile.ZipFile(path, 'w', zipfile.ZIP_DEFLATED) as archive:
+        def write(name, value):
+            with archive.open(name + '.npy', 'w', force_zip64=True) as f:
+                np.lib.format.write_array(f, np.asanyarray(value), allow_pickle=False)
+
+        for k, start in enumerate(range(0, available, chunk)):
+            y = np.asarray(trajectory.y[start : min(start + chunk, available)], dtype=float)
+            # The quantities of this chunk alone, from the states already read
+            window = Trajectory(t[start : start + len(y)], trajectory.masses, y, trajectory.G)
+            for name in SUMMARIZED:
+                values = getattr(window, name)[:]
+                lows[name].append(values.min(axis=0))
+                highs[name].append(values.max(axis=0))
+            write(f'y_{k}', shuffle(y))
+
+        for name in SUMMARIZED:
+            write('lows_' + name, np.array(lows[name]))
+            write('highs_' + name, np.array(highs[name]))
+
+        members = dict(format=FORMAT, params=json.dumps(params or {}), masses=trajectory.masses,
+                       G=trajectory.G, available=available, events=json.dumps(trajectory.events), chunk=chunk)
+        # Grids from np.arange are stored as three numbers instead of a huge array
+        step = uniform_step(t, chunk)
+        if step is not None:
+            members.update(t_start=t[0], t_step=step, samples=len(t))
+        else:
+            members.update(t=t)
+        for name, value in members.items():
+            write(name, value)
+
+
+def uniform_step(t, chunk=CHUNK):
+    """Step of an evenly spaced grid t, or None, checked a chunk at a time."""
+    step = (t[-1] - t[0]) / (len(t) - 1) if len(t) > 1 else 0.0
+    tolerance = 1e-9 * max(abs(step), 1)
+    for start in range(0, len(t), chunk):
+        block = np.asarray(t[start : start + chunk])
+        if not np.allclose(block, t[0] + step * np.arange(start, start + len(block)), rtol=0, atol=tolerance):
+            return None
+    return step
+
+
+def shuffle(y):
+    """Regroup the bytes of a float64 [sample, column] block into planes.
+
+    Neighbouring samples of a column differ little, so their high bytes
+    repeat, which deflate compresses far better than interleaved floats.
+    This is the shuffle filter of HDF5.
+    """
+    columns = np.ascontiguousarray(np.asarray(y, dtype=float).T)
+    return np.ascontiguousarray(columns.view(np.uint8).reshape(columns.shape + (8,)).transpose(2, 0, 1))
+
+
+def unshuffle(planes):
+    bytes_ = np.ascontiguousarray(planes.transpose(1, 2, 0))
+    return bytes_.view(float).reshape(bytes_.shape[:2]).T
+
+
+class ChunkedStates:
+    """The states of a run file, decompressed chunk by chunk on access.
+
+    Supports y[start:stop], y[num] and y[start:stop, columns], which is all
+    Trajectory needs. The most recently read chunks are kept decoded.
+    """
+
+    def __init__(self, archive, chunk, length, width):
+        self.archive = archive
+        self.chunk = chunk
+        self.length = length
+        self.shape = (length, width)
+        self.read = functools.lru_cache(maxsize=8)(self.read_chunk)
+
+    def read_chunk(self, k):
+        return unshuffle(self.archive[f'y_{k}'])
+
+    def __len__(self):
+        return self.length
+
+    def __getitem__(self, key):
+        if not isinstance(key, tuple):
+            key = (key,)
+        first, rest = key[0], key[1:]
+
+        if isinstance(first, slice):
+            # Read in ascending order, then stepped, also backwards
+            rows = range(self.length)[first]
+            start = min(rows, default=0)
+            stop = max(rows, default=start - 1) + 1
+        else:
+            start = range(self.length)[first]
+            stop = start + 1
+
+        if stop == start:
+            values = np.empty((0, self.shape[1]))
+        else:
+            first_chunk, last_chunk = start // self.chunk, (stop - 1) // self.chunk
+            values = np.concatenate([self.read(k) for k in range(first_chunk, last_chunk + 1)])
+            offset = first_chunk * self.chunk
+            values = values[start - offset : stop - offset]
+
+        if isinstance(first, slice):
+            values = values[rows[0] - start :: rows.step][: len(rows)] if rows else values
+        else:
+            values = values[0]
+        return values[(slice(None),) * (values.ndim - 1) + rest] if rest else values
+
+
+def load(path):
+    """Open a run file, returns (trajectory, params).
+
+    Only the metadata is read here, the states stay compressed in the file
+    until samples are asked for.
+    """
+    from .core import Trajectory
+
+    archive = np.load(path)
+    if int(archive['format']) > FORMAT:
+        raise ValueError(f'{path} was written by a newer version (format {int(archive["format"])})')
+
+    if 't' in archive.files:
+        t = archive['t']
+    else:
+        t = float(archive['t_start']) + float(archive['t_step']) * np.arange(int(archive['samples']))
+
+    masses = archive['masses']
+    available = int(archive['available'])
+    chunk = int(archive['chunk'])
+
+    y = ChunkedStates(archive, chunk, available, 6 * len(masses))
+    trajectory = Trajectory(t, masses, y, float(archive['G']))
+    trajectory.available = available
+    trajectory.events = [tuple(event) for event in json.loads(str(archive['events']))]
+
+    for name in SUMMARIZED:
+        getattr(trajectory, name).summarize(chunk, archive['lows_' + name], archive['highs_' + name])
+
+    return trajectory, json.loads(str(archive['params']))
+
@@ -0,0 +1,77 @@
+"""Trajectories stored as memory mapped .npy files.
+
+A run is a directory holding the time grid, the masses and the states in
+the usual [sample, r1 .. rN, v1 .. vN] layout as plain .npy files, and a
+small JSON file with G, the number of computed samples and the events:
+
+    run/t.npy  run/masses.npy  run/y.npy  run/meta.json
+
+stream() writes the states straight into y.npy, save() copies those of any
+finished trajectory there, and load() maps them back read only, so none of
+them needs the run to fit in memory. All other quantities of a Trajectory
+are derived from the states for the windows that are read.
+"""
+import json
+import os
+
+import numpy as np
+
+
+def create(directory, t, masses, G, width):
+    """An empty trajectory backed by new files in directory."""
+    # Imported here, core imports this module
+    from .core import Trajectory
+
+    os.makedirs(directory, exist_ok=True)
+    np.save(os.path.join(directory, 't.npy'), t)
+    np.save(os.path.join(directory, 'masses.npy'), masses)
+    y = np.lib.format.open_memmap(os.path.join(directory, 'y.npy'), mode='w+', dtype=float, shape=(len(t), width))
+
+    trajectory = Trajectory(t, masses, y, G)
+    trajectory.directory = directory
+    flush(trajectory)
+    return trajectory
+
+
+def flush(trajectory):
+    """Write the computed states and the metadata to disk."""
+    trajectory.y.flush()
+    meta = dict(G=trajectory.G, available=trajectory.available, events=trajectory.events)
+    partial = os.path.join(trajectory.directory, 'meta.json.partial')
+    with open(partial, 'w') as f:
+        json.dump(meta, f)
+    os.replace(partial, os.path.join(trajectory.directory, 'meta.json'))
+
+
+def save(directory, trajectory, chunk=1 << 16):
+    """Write the computed samples of any trajectory to new files in directory.
+
+    The states are copied `chunk` samples at a time, so trajectories read
+    from files are never loaded whole.
+    """
+    copy = create(directory, np.asarray(trajectory.t), trajectory.masses, trajectory.G, 6 * trajectory.n)
+    for start in range(0, trajectory.available, chunk):
+        stop = min(start + chunk, trajectory.available)
+        copy.y[start:stop] = trajectory.y[start:stop]
+    copy.fill(0, trajectory.available)
+    copy.events = list(trajectory.events)
+    flush(copy)
+    return copy
+
+
+def load(directory, mode='r'):
+    """Map the trajectory stored in directory, read only by default."""
+    from .core import Trajectory
+
+    with open(os.path.join(directory, 'meta.json')) as f:
+        meta = json.load(f)
+
+    t = np.load(os.path.join(directory, 't.npy'), mmap_mode='r')
+    masses = np.load(os.path.join(directory, 'masses.npy'))
+    y = np.load(os.path.join(directory, 'y.npy'), mmap_mode=mode)
+
+    trajectory = Trajectory(t, masses, y, meta['G'])
+    trajectory.directory = directory
+    trajectory.available = meta['available']
+    trajectory.events = [tuple(event) for event in meta['events']]
+    return trajectory
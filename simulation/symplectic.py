@@ -0,0 +1,136 @@
+"""Fixed-step symplectic integrators.
+
+These take `substeps` steps per interval of the time grid and keep the
+energy error bounded over long runs instead of letting it drift.
+
+verlet         velocity Verlet (kick-drift-kick leapfrog), 2nd order
+yoshida4       Yoshida's 4th order composition of three leapfrog steps
+yoshida6       Yoshida's 6th order composition (solution A) of seven steps
+wisdom-holman  Kepler drift in Jacobi coordinates with interaction kicks,
+               accurate for hierarchical systems around a dominant body 1
+"""
+import numpy as np
+
+from . import kernels
+from .kepler import kepler_step
+from .nbody import NBodyProblem
+
+# Yoshida, Phys. Lett. A 150 (1990) 262
+_cbrt2 = 2 ** (1 / 3)
+YOSHIDA4 = (1 / (2 - _cbrt2), -_cbrt2 / (2 - _cbrt2), 1 / (2 - _cbrt2))
+_w1, _w2, _w3 = -1.17767998417887, 0.235573213359357, 0.784513610477560
+YOSHIDA6 = (_w3, _w2, _w1, 1 - 2 * (_w1 + _w2 + _w3), _w1, _w2, _w3)
+
+COMPOSITIONS = {
+    'verlet': (1.0,),
+    'yoshida4': YOSHIDA4,
+    'yoshida6': YOSHIDA6,
+}
+
+METHODS = tuple(COMPOSITIONS) + ('wisdom-holman',)
+
+
+def leapfrog(model, y0, t, weights, substeps=1):
+    """Compose kick-drift-kick leapfrog steps of relative length weights.
+
+    y0 may carry leading axes, e.g. (M, 6N) for the members of an ensemble,
+    as long as model.accelerations accepts positions of the matching shape.
+    A compiled NBodyProblem runs the whole loop in kernels.leapfrog, other
+    models, e.g. the threaded TiledProblem, are stepped through their own
+    accelerations. Returns the states with shape (len(t),) + y0.shape.
+    """
+    n = model.n
+    y = np.empty((len(t),) + y0.shape)
+    if isinstance(model, NBodyProblem) and model.jit and y0.ndim == 1:
+        return kernels.leapfrog(y0, model.Gm, np.asarray(t, dtype=float), np.array(weights), substeps, y)
+    y[0] = y0
+
+    shape = y0.shape[:-1] + (n, 3)
+    r = y0[..., : 3 * n].reshape(shape).copy()
+    v = y0[..., 3 * n :].reshape(shape).copy()
+    a = np.empty(shape)
+    model.accelerations(r, a)
+
+    for k in range(1, len(t)):
+        h = (t[k] - t[k - 1]) / substeps
+        for _ in range(substeps):
+            for w in weights:
+                v += (0.5 * w * h) * a
+                r += (w * h) * v
+                model.accelerations(r, a)
+                v += (0.5 * w * h) * a
+        y[k, ..., : 3 * n] = r.reshape(y0.shape[:-1] + (3 * n,))
+        y[k, ..., 3 * n :] = v.reshape(y0.shape[:-1] + (3 * n,))
+
+    return y
+
+
+def to_jacobi(x, masses, eta):
+    """Jacobi coordinates of positions or velocities x, shape (N, 3).
+
+    Row 0 is the center of mass, row i the offset of body i from the center
+    of mass of bodies 0 .. i - 1. eta is the cumulative sum of masses.
+    """
+    com = np.cumsum(masses[:, np.newaxis] * x, axis=0) / eta[:, np.newaxis]
+    out = np.empty_like(x)
+    out[0] = com[-1]
+    out[1:] = x[1:] - com[:-1]
+    return out
+
+
+def from_jacobi(j, masses, eta):
+    # com[i - 1] = j[0] - sum over k >= i of m_k j_k / eta_k
+    terms = masses[1:, np.newaxis] * j[1:] / eta[1:, np.newaxis]
+    com = j[0] - np.cumsum(terms[::-1], axis=0)[::-1]
+    out = np.empty_like(j)
+    out[0] = com[0]
+    out[1:] = j[1:] + com
+    return out
+
+
+def wisdom_holman(model, y0, t, substeps=1):
+    """Wisdom-Holman map in Jacobi coordinates.
+
+    Jacobi body i follows a Kepler orbit around the inner bodies with
+    mu_i = G (m_0 + ... + m_i); the rest of the interaction enters through
+    kicks. Exact for two bodies, and the kicks stay small as long as body 1
+    dominates the mass.
+    """
+    n = model.n
+    masses = model.masses
+    eta = np.cumsum(masses)
+    mu = model.G * eta[1:]
+
+    y = np.empty((len(t), 6 * n))
+    y[0] = y0
+
+    rho = to_jacobi(y0[: 3 * n].reshape(n, 3), masses, eta)
+    rhodot = to_jacobi(y0[3 * n :].reshape(n, 3), masses, eta)
+    a = np.empty((n, 3))
+
+    def kick(h):
+        model.accelerations(from_jacobi(rho, masses, eta), a)
+        aj = to_jacobi(a, masses, eta)[1:]
+        # Take out the Kepler part of the acceleration, the drift handles it
+        dist = np.linalg.norm(rho[1:], axis=1)
+        aj += (mu / dist ** 3)[:, np.newaxis] * rho[1:]
+        rhodot[1:] += h * aj
+
+    for k in range(1, len(t)):
+        h = (t[k] - t[k - 1]) / substeps
+        for _ in range(substeps):
+            kick(0.5 * h)
+            rho[0] += h * rhodot[0]
+            rho[1:], rhodot[1:] = kepler_step(mu, rho[1:], rhodot[1:], h)
+            kick(0.5 * h)
+        y[k, : 3 * n] = from_jacobi(rho, masses, eta).ravel()
+        y[k, 3 * n :] = from_jacobi(rhodot, masses, eta).ravel()
+
+    return y
+
+
+def integrate(model, y0, t, method, substeps=1):
+    y0 = np.asarray(y0, dtype=float)
+    if method == 'wisdom-holman':
+        return wisdom_holman(model, y0, t, substeps)
+    return leapfrog(model, y0, t, COMPOSITIONS[method], substeps)